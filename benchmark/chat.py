@@ -0,0 +1,110 @@
+import aiohttp
+import asyncio
+import logging
+import sys
+import time
+
+from aiohttp import web
+from json import dumps
+
+# Discuss reads its config relative to the repository, so run this from there.
+sys.path.insert(0, "source")
+import discuss
+
+
+response_words = ("Did you know that the Mystery Dungeon series started on the Super Famicom? " * 60).split(" ")
+
+
+# Stands in for the chat completions endpoint, sending one word per event like a slow model would.
+def create_app(delay):
+    async def completions(request):
+        data = await request.json()
+        if not data.get("stream"):
+            await asyncio.sleep(delay * len(response_words))
+            return web.json_response({"choices": [{"message": {"content": " ".join(response_words)}}]})
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for index, word in enumerate(response_words):
+            chunk = {"choices": [{"delta": {"content": word if index == 0 else " " + word}}]}
+            await response.write(f"data: {dumps(chunk)}\n\n".encode())
+            await asyncio.sleep(delay)
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", completions)
+    return app
+
+
+class MockReply:
+    def __init__(self, message, content):
+        self.message, self.content = message, content
+
+
+    async def edit(self, content):
+        self.message.edits += 1
+        self.content = content
+        return self
+
+
+class MockMessage:
+    def __init__(self):
+        self.channel = self
+        self.replies, self.edits, self.first_reply = [], 0, None
+
+
+    async def reply(self, content, **kwargs):
+        self.first_reply = time.perf_counter()
+        return await self.send(content)
+
+
+    async def send(self, content, **kwargs):
+        self.replies.append(MockReply(self, content))
+        return self.replies[-1]
+
+
+class MockBot:
+    def __init__(self, session):
+        self.session = session
+
+
+    async def wait_until_ready(self):
+        await asyncio.Event().wait()
+
+
+async def main(delay=0.005):
+    logging.disable(logging.INFO)
+    runner = web.AppRunner(create_app(delay))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    discuss.discuss["endpoint"] = f"http://{host}:{port}/v1/chat/completions"
+    discuss.discuss["cache"]["path"] = None # Keep the benchmark's responses out of the real cache.
+
+    async with aiohttp.ClientSession() as session:
+        cog = discuss.Discuss(MockBot(session))
+        conversation = [{"role": "user", "content": "Tell me a fact."}]
+
+        start = time.perf_counter()
+        await cog.send_to_gpt(conversation)
+        print(f"complete   first reply {(time.perf_counter() - start) * 1000:8.1f}ms")
+
+        cog.cache.entries.clear()
+        for run in ["streaming", "cached"]:
+            message = MockMessage()
+            start = time.perf_counter()
+            response = await cog.stream_reply(message, conversation)
+            total = time.perf_counter() - start
+            if "".join(reply.content for reply in message.replies) != response:
+                raise AssertionError("The streamed replies don't add up to the response.")
+            print(f"{run:<10} first reply {(message.first_reply - start) * 1000:8.1f}ms  total {total * 1000:8.1f}ms  "
+                f"messages {len(message.replies)}  edits {message.edits}  "
+                f"longest {max(len(reply.content) for reply in message.replies)} characters")
+        cog.discussion_starter.cancel()
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
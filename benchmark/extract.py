@@ -0,0 +1,46 @@
+import re
+import sys
+import timeit
+
+from bs4 import BeautifulSoup
+from json import loads
+from pathlib import Path
+
+# The scraper reads its config relative to the repository, so run this from there.
+sys.path.insert(0, "source")
+from scraper import extract_initial_data, extract_meta
+
+
+fixtures = Path(__file__).parent / "fixtures"
+
+
+# The way the scraper read YouTube pages before, kept here to compare against.
+def soup_extract(html):
+    soup = BeautifulSoup(html, "html.parser")
+    script = soup.find("script", string=re.compile("ytInitialData"))
+    json_text = re.search(r"ytInitialData\s*=\s*({.*?});", script.string).group(1)
+    author_name = soup.find("meta", {"property": "og:title"})["content"]
+    author_art = soup.find("meta", {"property": "og:image"})["content"]
+    return loads(json_text), author_name, author_art
+
+
+def fast_extract(html):
+    meta = extract_meta(html)
+    return extract_initial_data(html), meta["og:title"], meta["og:image"]
+
+
+def main(repeat=20):
+    for fixture in ["youtube_videos.html", "youtube_releases.html"]:
+        html = (fixtures / fixture).read_text()
+        if soup_extract(html) != fast_extract(html):
+            raise AssertionError(f"The extractors disagree on {fixture}.")
+
+        # Take the best run of each, since that is the least disturbed by other work.
+        soup_time = min(timeit.repeat(lambda: soup_extract(html), number=1, repeat=repeat))
+        fast_time = min(timeit.repeat(lambda: fast_extract(html), number=1, repeat=repeat))
+        print(f"{fixture} ({len(html) // 1024} KiB): soup {soup_time * 1000:.1f}ms, "
+            f"fast {fast_time * 1000:.1f}ms, {soup_time / fast_time:.1f}x faster")
+
+
+if __name__ == "__main__":
+    main()
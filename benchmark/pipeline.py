@@ -0,0 +1,150 @@
+import aiohttp
+import asyncio
+import logging
+import sys
+import time
+import tracemalloc
+
+from aiohttp import web
+from hashlib import sha256
+from pathlib import Path
+from urllib.parse import urlsplit
+from uuid import uuid4
+
+# The scraper reads its config relative to the repository, so run this from there.
+sys.path.insert(0, "source")
+import scraper
+
+
+fixtures = Path(__file__).parent / "fixtures"
+
+
+# Stands in for SoundCloud and YouTube. The paths of both sites don't overlap, so one server is enough.
+def create_app():
+    pages = {name: (fixtures / f"{name}.html").read_text() for name in
+        ["soundcloud_tracks", "soundcloud_track", "youtube_videos", "youtube_releases", "youtube_watch"]}
+
+    async def serve(request):
+        path = request.path
+        if path == "/nightkingale/tracks":
+            page = pages["soundcloud_tracks"]
+        elif path.startswith("/nightkingale/"):
+            page = pages["soundcloud_track"]
+        elif path.endswith("/videos"):
+            page = pages["youtube_videos"]
+        elif path.endswith("/releases"):
+            page = pages["youtube_releases"]
+        elif path == "/watch":
+            page = pages["youtube_watch"]
+        else:
+            raise web.HTTPNotFound()
+
+        # YouTube sends no validators, and every response differs a little, like the nonces in the real pages.
+        if path.startswith("/@") or path == "/watch":
+            return web.Response(text=page.replace("</body>", f"<!-- {uuid4()} --></body>"), content_type="text/html")
+
+        # Answer conditional requests the way SoundCloud can.
+        etag = '"' + sha256(page.encode()).hexdigest()[:16] + '"'
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.Response(text=page, content_type="text/html", headers={"ETag": etag})
+
+    app = web.Application()
+    app.router.add_get("/{path:.*}", serve)
+    return app
+
+
+# Sends every request to the local server instead, counting them on the way.
+class LocalSession:
+    def __init__(self, session, base_url):
+        self.session, self.base_url = session, base_url
+        self.requests = 0
+
+
+    def get(self, url, **kwargs):
+        self.requests += 1
+        parts = urlsplit(url)
+        return self.session.get(self.base_url + parts.path + (f"?{parts.query}" if parts.query else ""), **kwargs)
+
+
+class MockChannel:
+    def __init__(self):
+        self.messages = 0
+
+
+    async def send(self, *args, **kwargs):
+        self.messages += 1
+
+
+class MockBot:
+    def __init__(self, session):
+        self.session, self.channel = session, MockChannel()
+
+
+    def get_channel(self, id):
+        return self.channel
+
+
+# Times the parsers inside the worker pool, so waiting for a free worker isn't counted.
+def time_parsers(cog):
+    parse, stats = cog.parse, {"parse": 0.0}
+
+    async def timed_parse(parser, *args):
+        def timed(*args):
+            start = time.perf_counter()
+            try:
+                return parser(*args)
+            finally:
+                stats["parse"] += time.perf_counter() - start
+        return await parse(timed, *args)
+
+    cog.parse = timed_parse
+    return stats
+
+
+async def measure(cog, source, session, stats):
+    stats["parse"], session.requests, cog.bot.channel.messages = 0.0, 0, 0
+    cog.announcer.sent.clear() # Every source shares the mock channel, so forget its rate limit.
+
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    await cog.checks[source](session)
+    await cog.announcer.flush_all()
+    stats["wall"] = time.perf_counter() - start
+    stats["memory"] = tracemalloc.get_traced_memory()[1]
+    stats["requests"], stats["messages"] = session.requests, cog.bot.channel.messages
+    return stats
+
+
+async def main():
+    logging.disable(logging.INFO) # Only the results are wanted, not every request and announcement.
+    runner = web.AppRunner(create_app())
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+
+    # Keep the benchmark away from the real database and channels.
+    scraper.scraper["database"] = ":memory:"
+    scraper.config["channels"].setdefault("#content-updates", 0)
+
+    tracemalloc.start()
+    async with aiohttp.ClientSession() as client:
+        session = LocalSession(client, f"http://{host}:{port}")
+        cog = scraper.Scraper(MockBot(session))
+        stats = time_parsers(cog)
+        for source in cog.checks:
+            # Seed the store, so everything on the listing counts as new.
+            cog.seen.add(source, ["https://example.com/seed"])
+            for run in ["new", "unchanged"]:
+                await measure(cog, source, session, stats)
+                print(f"{source:<14} {run:<10} wall {stats['wall'] * 1000:8.1f}ms  "
+                    f"parse {stats['parse'] * 1000:8.1f}ms  requests {stats['requests']:3}  "
+                    f"announced {stats['messages']:3}  peak {stats['memory'] / 1024 / 1024:6.1f} MiB")
+        cog.pool.shutdown()
+    tracemalloc.stop()
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
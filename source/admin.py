@@ -123,5 +123,16 @@ class Admin(commands.Cog):
         await ctx.reply("The sync has been completed successfully.")
 
 
+    @commands.command(hidden=True)
+    @commands.is_owner()
+    async def pool(self, ctx):
+        "Shows the shared HTTP connection pool statistics."
+        stats = self.bot.pool_stats()
+        embed = discord.Embed(title="HTTP Connection Pool", color=0xffff00)
+        for name, value in stats.items():
+            embed.add_field(name=name.replace("_", " ").capitalize(), value=f"`{value}`", inline=True)
+        await ctx.reply(embed=embed)
+
+
 async def setup(bot: commands.Bot):
     await bot.add_cog(Admin(bot))
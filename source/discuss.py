@@ -2,14 +2,30 @@ import aiohttp
 import asyncio
 import datetime
 import discord
+import os
 import random
+import re
+import tiktoken
+import time
 
+from base64 import b64encode
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
 from discord.ext import commands, tasks
-from json import loads
+from email.utils import parsedate_to_datetime
+from hashlib import sha256
+from io import BytesIO
+from json import dumps, loads
 from pathlib import Path
 
 from logger import create_logger
 
+# Pillow is only needed to shrink image attachments, which is skipped without it.
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
 
 utc = datetime.timezone.utc
 
@@ -19,60 +35,504 @@ discuss = loads(Path("config/discuss.json").read_text())
 secret = loads(Path("config/secret.json").read_text())
 
 
+# Statuses that usually go away by themselves, so the request is worth trying again.
+retryable_statuses = {408, 409, 429, 500, 502, 503, 504}
+duration_pattern = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+duration_units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+class TokenEstimator:
+    # Counts tokens with the model's own tokenizer, falling back to an estimate if it can't be loaded.
+    def __init__(self, model, logger):
+        try:
+            self.encoding = tiktoken.encoding_for_model(model)
+        except Exception as error:
+            # The tokenizer is downloaded on first use, which may fail on an offline host.
+            self.encoding = None
+            logger.warning(f"The tokenizer could not be loaded, so tokens will be estimated. ({error})")
+
+
+    def count_text(self, text):
+        if self.encoding:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return len(text) // 4 + 1 # Roughly four characters per token in English.
+
+
+    def count(self, message):
+        tokens = 3 # Every message is wrapped in a few tokens of its own.
+        content = message["content"]
+        if isinstance(content, str):
+            return tokens + self.count_text(content)
+        for part in content:
+            if part["type"] == "text":
+                tokens += self.count_text(part["text"])
+            else:
+                tokens += discuss["conversation"]["image_tokens"]
+        return tokens
+
+
+# Flattens a message into plain text, such as for a summary transcript.
+def message_text(message):
+    content = message["content"]
+    if isinstance(content, str):
+        return content
+    return " ".join(part["text"] if part["type"] == "text" else "[image]" for part in content)
+
+
+# Cuts text at the last line break or space that fits, so words aren't split across messages.
+def split_text(text, limit=2000):
+    if len(text) <= limit:
+        return text
+    cut = max(text.rfind("\n", 0, limit), text.rfind(" ", 0, limit))
+    return text[:cut + 1] if cut > 0 else text[:limit]
+
+
+# Replays a finished response as if it was being streamed.
+async def replay(response):
+    yield response
+
+
+# Downscales an image to fit the given size and re-encodes it as a data URL. Runs in a thread.
+def shrink_image(data, max_size, image_format, quality):
+    with Image.open(BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image) # Keep photos the right way up once the metadata is gone.
+        image.thumbnail((max_size, max_size))
+        if image_format == "jpeg" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB") # JPEG has no transparency.
+        buffer = BytesIO()
+        image.save(buffer, format=image_format, quality=quality)
+    return f"data:image/{image_format};base64,{b64encode(buffer.getvalue()).decode()}"
+
+
+class TokenBucket:
+    # Allows short bursts of requests, then refills at a steady rate.
+    def __init__(self, rate, capacity):
+        self.rate, self.capacity = rate, capacity
+        self.tokens, self.updated = capacity, time.monotonic()
+        self.lock = asyncio.Lock()
+
+
+    async def acquire(self):
+        # Waiters are served in order, since they queue on the lock.
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    # Fails requests fast after repeated failures, letting one through again each time the cooldown passes.
+    def __init__(self, threshold, cooldown):
+        self.threshold, self.cooldown = threshold, cooldown
+        self.failures, self.opened = 0, None
+
+
+    def allow(self):
+        if self.opened is None:
+            return True
+        if time.monotonic() - self.opened >= self.cooldown:
+            # Let this request try, but keep the rest waiting until it is known to work.
+            self.opened = time.monotonic()
+            return True
+        return False
+
+
+    def record(self, success):
+        if success:
+            self.failures, self.opened = 0, None
+            return
+        self.failures += 1
+        if self.failures >= self.threshold:
+            self.opened = time.monotonic()
+
+
+# Reads how long the API asked to wait, from Retry-After or the rate limit headers.
+def requested_delay(headers):
+    if "retry-after-ms" in headers:
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    if "Retry-After" in headers:
+        try:
+            return float(headers["Retry-After"])
+        except ValueError:
+            pass
+        try:
+            # It can also be a date.
+            return max(0.0, (parsedate_to_datetime(headers["Retry-After"]) - datetime.datetime.now(utc)).total_seconds())
+        except (TypeError, ValueError):
+            pass
+
+    # The reset headers look like "1s", "6m0s" or "20ms", and only matter once nothing is remaining.
+    delays = []
+    for limit in ["requests", "tokens"]:
+        if headers.get(f"x-ratelimit-remaining-{limit}") == "0" and f"x-ratelimit-reset-{limit}" in headers:
+            delays.append(sum(float(amount) * duration_units[unit] for amount, unit in
+                duration_pattern.findall(headers[f"x-ratelimit-reset-{limit}"])))
+    return max(delays) if delays else None
+
+
+class ResponseCache:
+    # Remembers responses by a hash of the model and the normalized messages, dropping the least recently used.
+    def __init__(self, path):
+        self.path = path
+        self.entries = OrderedDict()
+        if path and os.path.exists(path):
+            # Only load the entries that haven't expired yet.
+            for key, (expires, response) in loads(Path(path).read_text()).items():
+                if expires > time.time():
+                    self.entries[key] = (expires, response)
+
+
+    @staticmethod
+    def key(model, messages):
+        def normalize(content):
+            if isinstance(content, str):
+                return " ".join(content.split())
+            return [dict(part, text=normalize(part["text"])) if part["type"] == "text" else part for part in content]
+
+        payload = [model, [{"role": message["role"], "content": normalize(message["content"])} for message in messages]]
+        return sha256(dumps(payload, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+    def get(self, key):
+        if key not in self.entries:
+            return None
+        expires, response = self.entries[key]
+        if expires <= time.time():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return response
+
+
+    def put(self, key, response):
+        self.entries[key] = (time.time() + discuss["cache"]["ttl"], response)
+        self.entries.move_to_end(key)
+        while len(self.entries) > discuss["cache"]["size"]:
+            self.entries.popitem(last=False)
+        self.save()
+
+
+    def save(self):
+        if not self.path:
+            return # The cache is only kept in memory.
+        # Check if the database directory exists, if not, create it.
+        if os.path.dirname(self.path) and not os.path.exists(os.path.dirname(self.path)):
+            os.makedirs(os.path.dirname(self.path))
+        Path(self.path).write_text(dumps(self.entries))
+
+
+class Conversation:
+    # Holds one system prompt, a running summary and the recent turns of a channel.
+    # The oldest turns are evicted to stay in budget, and later folded into the summary.
+    def __init__(self, estimator):
+        self.estimator = estimator
+        self.system, self.system_tokens = None, 0
+        self.summary, self.summary_tokens = None, 0
+        self.turns, self.turn_tokens = deque(), 0
+        self.evicted, self.evicted_tokens = deque(), 0
+
+
+    def set_system(self, prompt):
+        self.system = {"role": "system", "content": prompt}
+        self.system_tokens = self.estimator.count(self.system)
+        self.trim()
+
+
+    def append(self, role, content):
+        message = {"role": role, "content": content}
+        tokens = self.estimator.count(message)
+        self.turns.append((message, tokens))
+        self.turn_tokens += tokens
+        self.trim()
+
+
+    def trim(self):
+        limits = discuss["conversation"]
+        # The newest turn is always kept, even if it is over the budget by itself.
+        while len(self.turns) > 1 and (len(self.turns) > limits["max_turns"]
+            or self.tokens() > limits["token_budget"]):
+            message, tokens = self.turns.popleft()
+            self.turn_tokens -= tokens
+            self.evicted.append((message, tokens))
+            self.evicted_tokens += tokens
+
+        # While summaries keep failing, only the newest evicted turns are kept for the next attempt,
+        # so the transcript to summarize can't grow forever.
+        while self.evicted and self.evicted_tokens > limits["token_budget"]:
+            _, tokens = self.evicted.popleft()
+            self.evicted_tokens -= tokens
+
+
+    # Returns the turns that should be summarized, once the conversation has grown long enough.
+    def take_for_summary(self):
+        limits = discuss["conversation"]
+        if self.turn_tokens <= limits["summarize_at"] and not self.evicted:
+            return []
+        older = [message for message, _ in list(self.turns)[:-limits["keep_recent"]]]
+        return [message for message, _ in self.evicted] + older
+
+
+    # Replaces the summarized turns with the new summary, keeping anything added in the meantime.
+    def compact(self, messages, summary):
+        summarized = {id(message) for message in messages}
+        self.evicted = deque((message, tokens) for message, tokens in self.evicted if id(message) not in summarized)
+        self.evicted_tokens = sum(tokens for _, tokens in self.evicted)
+        while self.turns and id(self.turns[0][0]) in summarized:
+            _, tokens = self.turns.popleft()
+            self.turn_tokens -= tokens
+
+        self.summary = {"role": "system", "content": f"A summary of the earlier conversation: {summary}"}
+        self.summary_tokens = self.estimator.count(self.summary)
+        self.trim()
+
+
+    def tokens(self):
+        return self.system_tokens + self.summary_tokens + self.turn_tokens
+
+
+    # Returns the messages to send, optionally with a different system prompt.
+    def messages(self, system=None):
+        system = {"role": "system", "content": system} if system else self.system
+        return [message for message in [system, self.summary] if message] \
+            + [message for message, _ in self.turns]
+
+
 class Discuss(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.logger = create_logger(self.__class__.__name__)
+        self.estimator = TokenEstimator(discuss["model"], self.logger)
         self.conversations = {}
+        self.summaries = {}
+        self.cache = ResponseCache(discuss["cache"]["path"])
+        # Shrunk image attachments by their ID, dropping the least recently used.
+        self.images = OrderedDict()
+        if discuss["images"]["enabled"] and Image is None:
+            self.logger.warning("Pillow isn't installed, so images will be sent at full size.")
+        # Every request to the API shares these limits, whichever channel it is for.
+        self.slots = asyncio.Semaphore(discuss["queue"]["concurrency"])
+        self.bucket = TokenBucket(discuss["queue"]["requests_per_minute"] / 60, discuss["queue"]["burst"])
+        self.breaker = CircuitBreaker(discuss["retry"]["breaker"]["failures"], discuss["retry"]["breaker"]["cooldown"])
+        # Mentions waiting to be answered, and the task answering them, for each channel.
+        self.pending = {}
+        self.workers = {}
         self.discussion_starter.start()
 
+
+    async def cog_load(self):
+        # Prepare the first discussion starter right away, so it is ready when the time comes.
+        self.next_starter = asyncio.create_task(self.prepare_starter())
+
+
+    async def cog_unload(self):
+        self.discussion_starter.cancel()
+        self.next_starter.cancel()
+        for worker in list(self.workers.values()):
+            worker.cancel()
+
+
+    def get_conversation(self, channel_id):
+        # If the channel isn't in the conversations dictionary, add it.
+        if channel_id not in self.conversations:
+            self.conversations[channel_id] = Conversation(self.estimator)
+        return self.conversations[channel_id]
+
+
+    # Starts folding a channel's older turns into its summary, unless that is already happening.
+    def schedule_summary(self, channel_id):
+        conversation = self.get_conversation(channel_id)
+        messages = conversation.take_for_summary()
+        if not messages or channel_id in self.summaries:
+            return
+        task = asyncio.create_task(self.summarize(conversation, messages))
+        self.summaries[channel_id] = task
+        task.add_done_callback(lambda _: self.summaries.pop(channel_id, None))
+
+
+    async def summarize(self, conversation, messages):
+        prompt = (
+            f"You keep a running summary of a Discord conversation. Combine the existing summary, if any, "
+            f"with the new messages into one concise summary of at most {discuss['conversation']['summary_words']} "
+            f"words. Keep names, facts, decisions and open questions. Respond with only the summary."
+        )
+        request = [{"role": "system", "content": prompt}]
+        if conversation.summary:
+            request.append({"role": "user", "content": conversation.summary["content"]})
+        transcript = "\n".join(f"{message['role']}: {message_text(message)}" for message in messages)
+        request.append({"role": "user", "content": f"New messages:\n{transcript}"})
+
+        try:
+            summary = await self.send_to_gpt(request, model=discuss["conversation"]["summary_model"])
+        except Exception as error:
+            self.logger.error(f"An exception has been caught!", exc_info=error)
+            return
+        conversation.compact(messages, summary)
+        self.logger.info(f"Summarized {len(messages)} messages, the conversation is now "
+            f"estimated at {conversation.tokens()} tokens.")
+
         
+    # Opens a request to the openai endpoint, trying again with backoff on errors that usually recover.
+    @asynccontextmanager
+    async def request(self, data, stream=False):
+        retry = discuss["retry"]
+        headers = {
+            "Authorization": f"Bearer {secret['CHATGPT_API_KEY']}",
+            "Content-Type": "application/json",
+        }
+        deadline = time.monotonic() + retry["deadline"]
+
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise CircuitOpenError("ChatGPT has been failing, so requests are paused for now.")
+            delay = None
+            # Waiting for a turn counts towards the deadline too.
+            await asyncio.wait_for(self.bucket.acquire(), deadline - time.monotonic())
+            # A stream can take a while in total, so only a stalled one times out.
+            if stream:
+                timeout = aiohttp.ClientTimeout(sock_connect=retry["attempt_timeout"], sock_read=retry["attempt_timeout"])
+            else:
+                timeout = aiohttp.ClientTimeout(total=min(retry["attempt_timeout"], max(deadline - time.monotonic(), 1)))
+            async with self.slots:
+                try:
+                    response = await self.bot.session.post(discuss["endpoint"], headers=headers, json=data, timeout=timeout)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+                    failure = error
+                    self.breaker.record(False)
+                else:
+                    if response.ok:
+                        self.breaker.record(True)
+                        try:
+                            yield response
+                        finally:
+                            response.release()
+                        return
+
+                    # The conversation may be too long, so only keep the system prompt and latest turn.
+                    if response.status == 400 and len(data["messages"]) > 2:
+                        response.release()
+                        data = dict(data, messages=data["messages"][:1] + data["messages"][-1:])
+                        self.logger.warning("ChatGPT rejected the request, retrying with only the latest message.")
+                        continue
+
+                    delay = requested_delay(response.headers)
+                    try:
+                        response.raise_for_status()
+                    except aiohttp.ClientResponseError as error:
+                        failure = error
+                    if response.status not in retryable_statuses:
+                        raise failure
+                    # Rate limits mean the API is working, it just wants less.
+                    self.breaker.record(response.status == 429)
+
+            # Wait as long as the API asked for, otherwise back off exponentially with full jitter.
+            attempt += 1
+            if delay is None:
+                delay = random.uniform(0, min(retry["max_delay"], retry["base_delay"] * 2 ** attempt))
+            if attempt >= retry["attempts"] or time.monotonic() + delay > deadline:
+                raise failure
+            self.logger.warning(f"Request to ChatGPT failed ({failure}), retrying in {delay:.1f} seconds.")
+            await asyncio.sleep(delay)
+
+
     # Thank you, vgmoose, for the following code snippet!
     # this function sends the text verabtim to the openai endpoint
     # it may need an initial prompt to get the conversation going
-    async def send_to_gpt(self, conversation):
+    async def send_to_gpt(self, conversation, model=None):
         # talk to the openai endpoint and make a request
         # https://beta.openai.com/docs/api-reference/completions/create
-        headers = {
-            "Authorization": f"Bearer {secret['CHATGPT_API_KEY']}",
-            "Content-Type": "application/json",
+        data = {
+            "messages": conversation,
+            "model": model or discuss["model"],
         }
+        # Identical requests get the same response, without asking again.
+        key = self.cache.key(data["model"], conversation)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        async with self.request(data) as response:
+            response_data = await response.json()
+        content = response_data.get("choices", [{}])[0].get("message", {}).get("content", "")
+        self.cache.put(key, content)
+        return content
+
+
+    # Streams the response from the openai endpoint, yielding the text as it arrives.
+    async def stream_from_gpt(self, conversation, model=None):
         data = {
             "messages": conversation,
-            "model": "gpt-4o",
+            "model": model or discuss["model"],
+            "stream": True,
         }
-        # Retry the request up to 3 times if it fails.
-        retry_count = 0
-        # Keep trying until the request succeeds or the retry limit is reached.
-        while True:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    "https://api.openai.com/v1/chat/completions",
-                    headers=headers,
-                    json=data
-                ) as response:
-                    if response.status == 200:
-                        response_data = await response.json()
-                        return response_data.get("choices", [{}])[0].get("message", {}).get("content", "")
-                    elif response.status == 400 and retry_count < 3:
-                        # Wait for a certain period of time before retrying.
-                        await asyncio.sleep(5)
-                        retry_count += 1
-                        # Clear the conversation on the final try.
-                        if retry_count == 3:
-                            conversation = conversation[-2:]
-                        continue
-                    else:
-                        response.raise_for_status()
+        # Only opening the stream is retried, since part of the response may already be posted after that.
+        async with self.request(data, stream=True) as response:
+            # The response is a stream of server-sent events, one JSON chunk per data line.
+            async for line in response.content:
+                line = line.decode().strip()
+                if not line.startswith("data:"):
+                    continue
+                payload = line[5:].strip()
+                if payload == "[DONE]":
+                    break
+                choices = loads(payload).get("choices") or [{}]
+                delta = choices[0].get("delta", {}).get("content")
+                if delta:
+                    yield delta
 
 
-    # Every twelve hours, a prompt will be sent to the off-topic channel.
-    # Currently, it is either a fact or a question about a conversation starter.
-    @tasks.loop(time=datetime.time(hour=12, tzinfo=utc))
-    async def discussion_starter(self):
-        await self.bot.wait_until_ready()
+    # Replies early and edits the reply as the response streams in, continuing in new messages past 2000 characters.
+    async def stream_reply(self, message, conversation):
+        replies, response, offset = [], "", 0
+        is_open, last_edit = False, 0.0
+
+        async def show(text):
+            # Edit the open reply, or post the next one.
+            if is_open:
+                if replies[-1].content != text:
+                    replies[-1] = await replies[-1].edit(content=text)
+            else:
+                send = message.channel.send if replies else message.reply
+                replies.append(await send(text, allowed_mentions=discord.AllowedMentions.none()))
+
+        # A cached response is posted the same way, just all at once.
+        key = self.cache.key(discuss["model"], conversation)
+        cached = self.cache.get(key)
+        deltas = replay(cached) if cached is not None else self.stream_from_gpt(conversation)
+
+        async for delta in deltas:
+            response += delta
+            # Finish every message that is full, and continue in a new one.
+            while len(response) - offset > 2000:
+                text = split_text(response[offset:])
+                await show(text)
+                is_open, offset = False, offset + len(text)
+            if response[offset:].strip() and time.monotonic() - last_edit >= discuss["streaming"]["edit_interval"]:
+                await show(response[offset:])
+                is_open, last_edit = True, time.monotonic()
+
+        if response[offset:].strip():
+            await show(response[offset:])
+        if cached is None:
+            self.cache.put(key, response)
+        return response
+
+
+    # Currently, a discussion starter is either a fact or a question about a conversation starter.
+    def create_starter_prompt(self):
         discussion_starters = discuss["topics"]
-        channel = self.bot.get_channel(config["channels"]["#off-topic"])
 
         # The prompt for stating a fact about a discussion starter.
         fact_prompt = (
@@ -93,24 +553,140 @@ class Discuss(commands.Cog):
             f"Just state the question by itself, nothing such as 'Sure!'"
             f"Please state which ChatGPT model was used at the end of the message"
         )
-        prompt = random.choice([fact_prompt, question_prompt])
+        return random.choice([fact_prompt, question_prompt])
+
+
+    # Generates the next discussion starter ahead of time, so it can be posted right on schedule.
+    async def prepare_starter(self):
+        await self.bot.wait_until_ready()
+        prompt = self.create_starter_prompt()
+        conversation = self.get_conversation(config["channels"]["#off-topic"])
+        messages = conversation.messages(system=prompt)
+        # Log the estimation of tokens that will be used.
+        self.logger.info("Sending request to ChatGPT estimated to use "
+            f"{sum(self.estimator.count(message) for message in messages)} tokens.")
+        return prompt, await self.send_to_gpt(messages)
+
+
+    # Every twelve hours, a prompt will be sent to the off-topic channel.
+    @tasks.loop(time=datetime.time(hour=12, tzinfo=utc))
+    async def discussion_starter(self):
+        await self.bot.wait_until_ready()
+        channel = self.bot.get_channel(config["channels"]["#off-topic"])
+        conversation = self.get_conversation(channel.id)
+
+        async with channel.typing():
+            try:
+                prompt, response = await self.next_starter
+            except Exception as error:
+                # The prepared starter failed, so try once more now.
+                self.logger.error(f"An exception has been caught!", exc_info=error)
+                try:
+                    prompt, response = await self.prepare_starter()
+                except Exception as error:
+                    # An exception escaping would stop the loop for good, so skip today's starter instead.
+                    self.logger.error(f"No discussion starter could be made today!", exc_info=error)
+                    return
+            finally:
+                self.next_starter = asyncio.create_task(self.prepare_starter())
+            await channel.send(response)
+
+        # Use the prompt as the conversation's system prompt.
+        conversation.set_system(prompt)
+        conversation.append("assistant", response)
+        self.schedule_summary(channel.id)
+
+
+    # Returns a small inline copy of an image attachment, or its URL if it can't be shrunk.
+    async def prepare_image(self, attachment):
+        images = discuss["images"]
+        if not images["enabled"] or Image is None or attachment.size > images["max_download"]:
+            return attachment.url
+        if attachment.id in self.images:
+            self.images.move_to_end(attachment.id)
+            return self.images[attachment.id]
+
+        try:
+            data = await attachment.read()
+            url = await asyncio.to_thread(shrink_image, data, images["max_size"], images["format"], images["quality"])
+        except Exception as error:
+            self.logger.error(f"An exception has been caught!", exc_info=error)
+            return attachment.url
+        self.logger.info(f"Shrunk {attachment.filename} from {attachment.size} to {len(url)} bytes.")
+
+        self.images[attachment.id] = url
+        while len(self.images) > images["cache_size"]:
+            self.images.popitem(last=False)
+        return url
+
+
+    def create_chat_prompt(self, guild, user_names):
+        # Get the names of the bot and server.
+        bot_name = guild.get_member(self.bot.user.id).display_name
+        server_name = guild.name
+
+        # Create the prompt using the above variables.
+        return (
+            f"You are a friendly chat bot named {bot_name}. You are designed to assist users on a "
+            f"Discord server called {server_name}. Currently, you are conversing with {', '.join(user_names)}. "
+            f"Please provide helpful and concise responses, keeping in mind the 2000 character limit "
+            f"for each message. Your goal is to provide valuable assistance and engage in meaningful "
+            f"conversations with users. If possible, keep responses short and to the point, a few "
+            f"sentences at most."
+            f"Please also state which ChatGPT model was used to generate the response at the end of the message."
+        )
+
+
+    # Queues a mention for its channel, starting a worker for the channel if there isn't one yet.
+    def enqueue(self, message, request):
+        self.pending.setdefault(message.channel.id, []).append((message, request))
+        if message.channel.id not in self.workers:
+            self.workers[message.channel.id] = asyncio.create_task(self.answer_channel(message.channel))
+
+
+    # Answers a channel's mentions one request at a time, so its conversation is never changed mid-request.
+    async def answer_channel(self, channel):
+        try:
+            while self.pending.get(channel.id):
+                # Everything that arrived while the last request was in flight is answered together.
+                batch = self.pending.pop(channel.id)
+                try:
+                    await self.answer(channel, batch)
+                except Exception as error:
+                    self.logger.error(f"An exception has been caught!", exc_info=error)
+        finally:
+            # Nothing is awaited after the last check, so no mention can slip in unanswered.
+            self.workers.pop(channel.id, None)
+
+
+    async def answer(self, channel, batch):
+        message = batch[-1][0]
+        user_names = list(dict.fromkeys(message.author.display_name for message, _ in batch))
+
+        # Replace the conversation's system prompt, rather than adding another one.
+        conversation = self.get_conversation(channel.id)
+        conversation.set_system(self.create_chat_prompt(message.guild, user_names))
+
+        # Add the requests to the conversation, saying who asked when several people did.
+        for mention, request in batch:
+            if len(user_names) > 1:
+                request[0]["text"] = f"{mention.author.display_name}: {request[0]['text']}"
+            conversation.append("user", request)
+        if len(batch) > 1:
+            self.logger.info(f"Answering {len(batch)} messages in one request.")
 
-        # If the channel isn't in the conversations dictionary, add it.
-        if channel.id not in self.conversations:
-            self.conversations[channel.id] = []
-        conversation = self.conversations[channel.id]
-
-        # Add the prompt to the conversation.
-        conversation.append({
-            "role": "system",
-            "content": prompt
-        })
         async with channel.typing():
             # Log the estimation of tokens that will be used.
             self.logger.info("Sending request to ChatGPT estimated to use "
-                f"{len(prompt)} tokens.")
-            response = await self.send_to_gpt(conversation)
-            await channel.send(response)
+                f"{conversation.tokens()} tokens.")
+            # Reply to the latest message, which the response follows.
+            if discuss["streaming"]["enabled"]:
+                response = await self.stream_reply(message, conversation.messages())
+            else:
+                response = await self.send_to_gpt(conversation.messages())
+                await message.reply(response, allowed_mentions=discord.AllowedMentions.none())
+            conversation.append("assistant", response)
+            self.schedule_summary(channel.id)
 
 
     # If the bot is mentioned, it will respond to the message with a GPT-3.5/4 response.
@@ -118,64 +694,24 @@ class Discuss(commands.Cog):
     async def on_message(self, message: discord.Message):
         if self.bot.user.mentioned_in(message) and message.author != self.bot.user and not message.mention_everyone \
             and message.channel == self.bot.get_channel(config["channels"]["#haikiri-hub"]):
-            # Get the names of the bot, user, and server.
-            bot_name = discord.utils.get(message.guild.members, id=self.bot.user.id).display_name
-            user_name = message.author.display_name
-            server_name = message.guild.name
-
-            # Create the prompt using the above variables.
-            prompt = (
-                f"You are a friendly chat bot named {bot_name}. You are designed to assist users on a "
-                f"Discord server called {server_name}. Currently, you are conversing with {user_name}. "
-                f"Please provide helpful and concise responses, keeping in mind the 2000 character limit "
-                f"for each message. Your goal is to provide valuable assistance and engage in meaningful "
-                f"conversations with users. If possible, keep responses short and to the point, a few "
-                f"sentences at most."
-                f"Please also state which ChatGPT model was used to generate the response at the end of the message."
-            )
-
-            # If the channel isn't in the conversations dictionary, add it.
-            if message.channel.id not in self.conversations:
-                self.conversations[message.channel.id] = []
-            conversation = self.conversations[message.channel.id]
-            if len(conversation) > 30:
-                while len(conversation) > 30:
-                    conversation.pop(0)  # Remove the oldest messages.
-            # Add the prompt to the conversation.
-            conversation.append({
-                "role": "system",
-                "content": prompt
-            })
-
             # If possible, change pings to be display names in the message.
             for mention in message.mentions:
                 message.content = message.content.replace(mention.mention, mention.display_name)
-            request = message.content
 
             # Initialize request with any text content in the message.
             request = [{"type": "text", "text": message.content}]
-            # Add each attachment URL as an image_url entry.
-            for attachment in message.attachments:
-                if attachment.content_type and attachment.content_type.startswith("image"):
-                    request.append({
-                        "type": "image_url",
-                        "image_url": {"url": attachment.url}
-                    })
-
-            # Add the request to the conversation.
-            conversation.append({
-                "role": "user",
-                "content": request
-            })
-            
+            # Add each image as an image_url entry, shrinking them all at once.
+            attachments = [attachment for attachment in message.attachments
+                if attachment.content_type and attachment.content_type.startswith("image")]
+            for url in await asyncio.gather(*(self.prepare_image(attachment) for attachment in attachments)):
+                request.append({
+                    "type": "image_url",
+                    "image_url": {"url": url}
+                })
+
             # Make sure the request isn't empty.
-            if request != "":
-                async with message.channel.typing():
-                    # Log the estimation of tokens that will be used
-                    self.logger.info("Sending request to ChatGPT estimated to use "
-                        f"{len(request) + len(prompt)} tokens.")
-                    response = await self.send_to_gpt(conversation)
-                    await message.reply(response, allowed_mentions=discord.AllowedMentions.none())
+            if message.content.strip() or len(request) > 1:
+                self.enqueue(message, request)
 
 
 async def setup(bot: commands.Bot):
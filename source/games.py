@@ -1,4 +1,3 @@
-import aiohttp
 import discord
 import random
 
@@ -11,7 +10,6 @@ from logger import create_logger
 class Games(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.session = aiohttp.ClientSession()
         self.logger = create_logger(self.__class__.__name__)
 
 
@@ -28,7 +26,7 @@ class Games(commands.Cog):
 
         # Check if the member has a RiiTag.
         await interaction.response.defer()
-        async with self.session.get(tag_link) as response:
+        async with self.bot.session.get(tag_link) as response:
             # Check if the response from the site actually contains an image.
             if response.status == 200 and response.headers["content-type"] == "image/png":
                 self.logger.info(f"A RiiTag was fetched for {member.display_name} at {tag_link}.")
@@ -53,7 +51,7 @@ class Games(commands.Cog):
         "Shows a trophy card from the PSNProfile service."
         # Check if the user has a PSNProfile.
         await interaction.response.defer()
-        async with self.session.get(f"https://card.psnprofiles.com/1/{user}.png") as response:
+        async with self.bot.session.get(f"https://card.psnprofiles.com/1/{user}.png") as response:
             # Check if the response from the site actually contains a profile.
             if response.status == 200:
                 self.logger.info(f"A PSNProfile was fetched for {user}.")
@@ -1,8 +1,14 @@
+import asyncio
 import discord
+import heapq
 import os
 import random
+import re
 import sqlite3
+import time
 
+from bisect import bisect_left, insort
+from concurrent.futures import ThreadPoolExecutor
 from discord import app_commands
 from discord.ext import commands
 from json import loads
@@ -11,40 +17,354 @@ from pathlib import Path
 from logger import create_logger
 
 
+gifting = loads(Path("config/gifting.json").read_text())
 secret = loads(Path("config/secret.json").read_text())
 
 
-# Check if the database directory exists, if not, create it.
-if not os.path.exists("database"):
-    os.makedirs("database")
+# Durations are written like "2d 6h" or "30m".
+duration_pattern = re.compile(r"(\d+)\s*([dhms])")
+duration_units = {"d": 86400, "h": 3600, "m": 60, "s": 1}
 
-# Connect to the database now that the directory exists.
-connection = sqlite3.connect("database/gifting.sqlite")
-cursor = connection.cursor()
+# Names have to fit in the Enter button's custom ID, which Discord caps at 100 characters.
+name_limit = 100 - len("giveaway:enter:")
 
 
-# Create tables if they don't exist.
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS Ongoing (
-    id TEXT PRIMARY KEY,
-    host INTEGER,
-    users TEXT
-)
-""")
+# Returns the duration in seconds, or None if it can't be read.
+def parse_duration(text):
+    if not re.fullmatch(r"\s*((\d+)\s*[dhms]\s*)+", text.lower()):
+        return None
+    return sum(int(amount) * duration_units[unit] for amount, unit in duration_pattern.findall(text.lower()))
 
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS Archived (
-    id TEXT PRIMARY KEY,
-    host INTEGER,
-    users TEXT
-)
-""")
+
+# Entrants used to be kept as a string of IDs in a users column, so move them into their own tables.
+def migrate(cursor):
+    version = cursor.execute("PRAGMA user_version").fetchone()[0]
+    if version < 1:
+        cursor.execute("BEGIN")
+        legacy_tables = []
+        for table in ["Ongoing", "Archived"]:
+            columns = [column[1] for column in cursor.execute(f"PRAGMA table_info({table})")]
+            if "users" in columns:
+                cursor.execute(f"ALTER TABLE {table} RENAME TO Legacy{table}")
+                legacy_tables.append(table)
+
+
+    # Create tables if they don't exist.
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS Ongoing (
+        id TEXT PRIMARY KEY,
+        host INTEGER,
+        ends INTEGER,
+        winners INTEGER,
+        channel INTEGER
+    )
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS Archived (
+        id TEXT PRIMARY KEY,
+        host INTEGER
+    )
+    """)
+
+    # Each entrant is one row, so joining, leaving and counting only touch the index.
+    for table in ["Participants", "ArchivedParticipants"]:
+        cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            giveaway_id TEXT,
+            user_id INTEGER,
+            PRIMARY KEY (giveaway_id, user_id)
+        ) WITHOUT ROWID
+        """)
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {table}ByUser ON {table} (user_id)")
+
+    # The winners are kept with the archive, so a draw isn't lost if the results can't be posted.
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS ArchivedWinners (
+        giveaway_id TEXT,
+        user_id INTEGER,
+        PRIMARY KEY (giveaway_id, user_id)
+    ) WITHOUT ROWID
+    """)
+
+
+    if version < 1:
+        for table in legacy_tables:
+            participants = "Participants" if table == "Ongoing" else "ArchivedParticipants"
+            for giveaway_id, host, users in cursor.execute(f"SELECT id, host, users FROM Legacy{table}").fetchall():
+                cursor.execute(f"INSERT INTO {table} (id, host) VALUES (?, ?)", (giveaway_id, host))
+                # Leaving used to cut the ID out of the string, which could leave pieces of other IDs behind.
+                cursor.executemany(f"INSERT OR IGNORE INTO {participants} (giveaway_id, user_id) VALUES (?, ?)",
+                    [(giveaway_id, int(user)) for user in (users or "").split() if user.isdigit()])
+            cursor.execute(f"DROP TABLE Legacy{table}")
+        cursor.execute("PRAGMA user_version = 1")
+        cursor.connection.commit()
+
+    # Giveaways can end by themselves, at a time and with a winner count chosen when they start.
+    if version < 2:
+        columns = [column[1] for column in cursor.execute("PRAGMA table_info(Ongoing)")]
+        for column in ["ends INTEGER", "winners INTEGER", "channel INTEGER"]:
+            if column.split()[0] not in columns:
+                cursor.execute(f"ALTER TABLE Ongoing ADD COLUMN {column}")
+        cursor.execute("PRAGMA user_version = 2")
+        cursor.connection.commit()
+
+
+class Database:
+    # Runs every query on a thread of its own, so disk access never blocks the event loop.
+    # Writes are committed together after a short delay, or once enough of them have piled up.
+    def __init__(self, path):
+        self.path = path
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gifting")
+        self.connection = None
+        self.writes, self.commit_task = 0, None
+
+
+    def connect(self):
+        # Check if the database directory exists, if not, create it.
+        if os.path.dirname(self.path) and not os.path.exists(os.path.dirname(self.path)):
+            os.makedirs(os.path.dirname(self.path))
+        # Only the database thread uses the connection. Its statement cache keeps the queries prepared.
+        self.connection = sqlite3.connect(self.path, cached_statements=64)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        migrate(self.connection.cursor())
+
+
+    async def run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+
+    async def open(self):
+        await self.run(self.connect)
+
+
+    async def close(self):
+        if self.commit_task:
+            self.commit_task.cancel()
+        await self.run(self.connection.commit)
+        await self.run(self.connection.close)
+        self.executor.shutdown()
+
+
+    async def fetchone(self, query, parameters=()):
+        return await self.run(lambda: self.connection.execute(query, parameters).fetchone())
+
+
+    async def fetchall(self, query, parameters=()):
+        return await self.run(lambda: self.connection.execute(query, parameters).fetchall())
+
+
+    # Runs the statements together, so a commit can't land between them, and returns their row counts.
+    # If one of them fails, the ones before it are undone too. A list of parameters runs the statement
+    # once for each of them.
+    async def write(self, *statements):
+        def execute():
+            # Releasing the outermost savepoint would commit, so keep it inside the batch's transaction.
+            if not self.connection.in_transaction:
+                self.connection.execute("BEGIN")
+            self.connection.execute("SAVEPOINT write")
+            try:
+                rowcounts = [(self.connection.executemany if isinstance(parameters, list) else self.connection.execute)
+                    (query, parameters).rowcount for query, parameters in statements]
+            except BaseException:
+                self.connection.execute("ROLLBACK TO write")
+                self.connection.execute("RELEASE write")
+                raise
+            self.connection.execute("RELEASE write")
+            return rowcounts
+
+        rowcounts = await self.run(execute)
+        self.writes += 1
+        if self.writes >= gifting["commits"]["batch"]:
+            await self.commit()
+        elif not self.commit_task:
+            self.commit_task = asyncio.create_task(self.commit_later())
+        return rowcounts
+
+
+    async def commit_later(self):
+        await asyncio.sleep(gifting["commits"]["delay"])
+        self.commit_task = None
+        await self.commit()
+
+
+    async def commit(self):
+        self.writes = 0
+        await self.run(self.connection.commit)
+
+
+class GiveawayIndex:
+    # Keeps the names of ongoing giveaways sorted, so autocomplete can find them without the database.
+    def __init__(self):
+        self.names = []
+
+
+    def add(self, name):
+        insort(self.names, (name.casefold(), name))
+
+
+    def remove(self, name):
+        index = bisect_left(self.names, (name.casefold(), name))
+        if index < len(self.names) and self.names[index][1] == name:
+            del self.names[index]
+
+
+    def __contains__(self, name):
+        index = bisect_left(self.names, (name.casefold(), name))
+        return index < len(self.names) and self.names[index][1] == name
+
+
+    # Returns the names starting with the prefix, ignoring case.
+    def search(self, prefix, limit=25):
+        prefix = prefix.casefold()
+        start = bisect_left(self.names, (prefix,))
+        names = []
+        for folded, name in self.names[start:start + limit]:
+            if not folded.startswith(prefix):
+                break
+            names.append(name)
+        return names
+
+
+class EnterButton(discord.ui.DynamicItem[discord.ui.Button], template=r"giveaway:enter:(?P<name>.+)"):
+    # The giveaway's name is part of the custom ID, so the button keeps working after a restart.
+    def __init__(self, name):
+        super().__init__(discord.ui.Button(label="Enter", style=discord.ButtonStyle.green, emoji="\N{WRAPPED PRESENT}",
+            custom_id=f"giveaway:enter:{name}"))
+        self.name = name
+
+
+    @classmethod
+    async def from_custom_id(cls, interaction, item, match):
+        return cls(match["name"])
+
+
+    async def callback(self, interaction: discord.Interaction):
+        await interaction.client.get_cog("Gifting").enter(interaction, self.name)
 
 
 class Gifting(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.logger = create_logger(self.__class__.__name__)
+        self.database = Database(gifting["database"])
+        self.index = GiveawayIndex()
+        # Giveaways that end by themselves, as a heap of (when to end, name, end time). Giveaways ended early stay in it,
+        # and are skipped once they come up.
+        self.schedule = []
+        self.rescheduled = asyncio.Event()
+        self.ending = set()
+        self.endings = set()
+        # Entries from the Enter button, by giveaway, waiting to be written together.
+        self.entries = {}
+        self.flush_task = None
+
+
+    async def cog_load(self):
+        await self.database.open()
+        for name, ends in await self.database.fetchall("SELECT id, ends FROM Ongoing"):
+            self.index.add(name)
+            if ends is not None:
+                self.schedule.append((ends, name, ends))
+        heapq.heapify(self.schedule)
+        self.scheduler = asyncio.create_task(self.run_scheduler())
+        self.bot.add_dynamic_items(EnterButton)
+
+
+    async def cog_unload(self):
+        self.bot.remove_dynamic_items(EnterButton)
+        self.scheduler.cancel()
+        for task in self.endings:
+            task.cancel()
+        if self.flush_task:
+            self.flush_task.cancel()
+        if not await self.flush_entries():
+            self.flush_task.cancel() # The database is closing, so there is no later to try again.
+        await self.database.close()
+
+
+    # Confirms an entry right away, while it waits in the buffer to be written.
+    async def enter(self, interaction, name):
+        if name not in self.index or name in self.ending:
+            await interaction.response.send_message("That giveaway has already ended!", ephemeral=True)
+            return
+        self.entries.setdefault(name, set()).add(interaction.user.id)
+        if not self.flush_task:
+            self.flush_task = asyncio.create_task(self.flush_later())
+        await interaction.response.send_message(f"You have entered the **{name}** giveaway! We wish you the best of luck!\n"
+            f"Changed your mind? Use `/gift {name}` to leave.", ephemeral=True)
+
+
+    async def flush_later(self):
+        await asyncio.sleep(gifting["entries"]["flush_delay"])
+        self.flush_task = None
+        await self.flush_entries()
+
+
+    # Writes every buffered entry at once, skipping giveaways that ended in the meantime.
+    # Returns whether the buffer could be written.
+    async def flush_entries(self):
+        if not self.entries:
+            return True
+        entries, self.entries = self.entries, {}
+        rows = [(name, user_id, name) for name, users in entries.items() for user_id in users]
+        try:
+            await self.database.write(("INSERT OR IGNORE INTO Participants (giveaway_id, user_id) "
+                "SELECT ?, ? WHERE EXISTS (SELECT 1 FROM Ongoing WHERE id = ?)", rows))
+        except Exception as error:
+            # These entries were already confirmed, so put them back and try again later.
+            self.logger.error(f"{len(rows)} entries from the Enter button could not be added!", exc_info=error)
+            for name, users in entries.items():
+                self.entries.setdefault(name, set()).update(users)
+            if not self.flush_task:
+                self.flush_task = asyncio.create_task(self.flush_later())
+            return False
+        self.logger.info(f"Added {len(rows)} entries from the Enter button.")
+        return True
+
+
+    # Entries are (when to end, name, end time), so a retry can come later than the giveaway's end time.
+    def schedule_end(self, ends, name, due=None):
+        heapq.heappush(self.schedule, (due or ends, name, ends))
+        self.rescheduled.set()
+
+
+    # Sleeps until the next giveaway is due, waking up early when an earlier one is scheduled.
+    async def run_scheduler(self):
+        await self.bot.wait_until_ready()
+        while True:
+            self.rescheduled.clear()
+            delay = self.schedule[0][0] - time.time() if self.schedule else None
+            if delay is None or delay > 0:
+                try:
+                    await asyncio.wait_for(self.rescheduled.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            # Each giveaway ends in a task of its own, so messaging its winners doesn't hold up the others.
+            _, name, ends = heapq.heappop(self.schedule)
+            task = asyncio.create_task(self.end_scheduled(ends, name))
+            self.endings.add(task)
+            task.add_done_callback(self.endings.discard)
+
+
+    async def end_scheduled(self, ends, name):
+        try:
+            giveaway_entry = await self.database.fetchone("SELECT * FROM Ongoing WHERE id = ?", (name,))
+            # Skip giveaways that were already ended by hand.
+            if not giveaway_entry or giveaway_entry[2] != ends:
+                return
+            channel = self.bot.get_channel(giveaway_entry[4]) or await self.bot.fetch_channel(giveaway_entry[4])
+            summary = await self.end_giveaway(name, giveaway_entry[1], giveaway_entry[3], channel.guild, channel.send)
+        except Exception as error:
+            # The giveaway is still ongoing, so try again later rather than leaving it until a restart.
+            retry_delay = gifting["schedule"]["retry_delay"]
+            self.logger.error(f"The {name} giveaway could not be ended, trying again in {retry_delay} seconds.", exc_info=error)
+            self.schedule_end(ends, name, due=time.time() + retry_delay)
+            return
+        self.logger.info(f"The {name} giveaway has ended by itself. {summary}")
 
 
     @app_commands.command()
@@ -52,57 +372,90 @@ class Gifting(commands.Cog):
         giveaway="The name of the giveaway to join or leave.")
     async def gift(self, interaction: discord.Interaction, giveaway: str):
         "Adds or removes yourself from a giveaway."
+        # Entries from the Enter button have to be written first, or they could be entered twice.
+        await self.flush_entries()
         # Check if the giveaway exists and is not archived.
-        cursor.execute("SELECT * FROM Ongoing WHERE id = ?", (giveaway,))
-        giveaway_entry = cursor.fetchone()
+        giveaway_entry = await self.database.fetchone("SELECT * FROM Ongoing WHERE id = ?", (giveaway,))
         if not giveaway_entry:
             await interaction.response.send_message("That giveaway does not exist! Make sure you typed the name exactly as announced.",
                 ephemeral=True)
             return
         
-        # Check if the user has already entered the giveaway.
-        if str(interaction.user.id) in giveaway_entry[2]:
-            cursor.execute("UPDATE Ongoing SET users = ? WHERE id = ?", (giveaway_entry[2].replace(str(interaction.user.id), ""), giveaway))
+        # Check if the user has already entered the giveaway, removing them if so.
+        left, = await self.database.write(("DELETE FROM Participants WHERE giveaway_id = ? AND user_id = ?",
+            (giveaway, interaction.user.id)))
+        if left:
             await interaction.response.send_message(f"You have left the **{giveaway}** giveaway. We're sorry to see you go!", ephemeral=True)
             self.logger.info(f"{interaction.user.name} has left the {giveaway} giveaway.")
-            connection.commit()
             return
         
         # Add the user to the giveaway.
-        cursor.execute("UPDATE Ongoing SET users = ? WHERE id = ?", (f"{giveaway_entry[2]} {interaction.user.id}", giveaway))
+        await self.database.write(("INSERT OR IGNORE INTO Participants (giveaway_id, user_id) VALUES (?, ?)",
+            (giveaway, interaction.user.id)))
         await interaction.response.send_message(f"You have entered the **{giveaway}** giveaway! We wish you the best of luck!", ephemeral=True)
         self.logger.info(f"{interaction.user.name} has joined the {giveaway} giveaway.")
-        connection.commit()
 
 
     @app_commands.command()
     @app_commands.describe(
         name="The name of the giveaway to manage.",
-        amount="The amount of winners to choose.")
+        amount="The amount of winners to choose.",
+        duration="When starting, how long until the giveaway ends by itself, like 2d 6h or 30m.",
+        winners="When starting with a duration, the amount of winners to choose at the end.")
     @app_commands.default_permissions(manage_messages=True)
-    async def give(self, interaction: discord.Interaction, name: str, amount: int = 0):
+    async def give(self, interaction: discord.Interaction, name: str, amount: int = 0,
+        duration: str = None, winners: int = 1):
         "Starts a giveaway, or ends it if amount is specified."
         if amount < 1:
-            # Check if the giveaway already exists.
-            cursor.execute("SELECT * FROM Ongoing WHERE id = ?", (name,))
-            giveaway_entry = cursor.fetchone()
+            if len(name) > name_limit:
+                await interaction.response.send_message(f"Please choose a name of at most {name_limit} characters.",
+                    ephemeral=True)
+                return
+
+            # Check if the giveaway already exists. Archived giveaways are kept by name, so their names can't be reused.
+            giveaway_entry = await self.database.fetchone("SELECT id FROM Ongoing WHERE id = ? "
+                "UNION ALL SELECT id FROM Archived WHERE id = ?", (name, name))
             if giveaway_entry:
                 await interaction.response.send_message("That giveaway already exists! Please choose a different name.",
                     ephemeral=True)
                 return
+
+            # Check if the giveaway should end by itself.
+            ends = None
+            if duration:
+                seconds = parse_duration(duration)
+                if not seconds or winners < 1:
+                    await interaction.response.send_message("Please give a duration like `2d 6h` or `30m`, "
+                        "and at least one winner.", ephemeral=True)
+                    return
+                ends = int(time.time()) + seconds
             
             # Create a new giveaway.
-            cursor.execute("INSERT INTO Ongoing (id, host, users) VALUES (?, ?, ?)", (name, interaction.user.id, ""))
-            await interaction.response.send_message(f"The **{name}** giveaway has been started! "
-                + "Please use the `end` action to choose a winner.",
-                ephemeral=True)
+            await self.database.write(("INSERT INTO Ongoing (id, host, ends, winners, channel) VALUES (?, ?, ?, ?, ?)",
+                (name, interaction.user.id, ends, winners if ends else None, interaction.channel_id)))
+            self.index.add(name)
+            if ends:
+                self.schedule_end(ends, name)
+                await interaction.response.send_message(f"The **{name}** giveaway has been started! "
+                    + f"It will end <t:{ends}:R> with {winners} winner{'s' if winners > 1 else ''}, "
+                    + "or use the `end` action to choose a winner sooner.",
+                    ephemeral=True)
+            else:
+                await interaction.response.send_message(f"The **{name}** giveaway has been started! "
+                    + "Please use the `end` action to choose a winner.",
+                    ephemeral=True)
             self.logger.info(f"{interaction.user.name} has started the {name} giveaway.")
 
+            # Announce the giveaway with a button to enter.
+            view = discord.ui.View(timeout=None)
+            view.add_item(EnterButton(name))
+            await interaction.followup.send(f"The **{name}** giveaway has started! Press the button below to enter"
+                + (f", it ends <t:{ends}:R>." if ends else "."), view=view)
+
         else:
             # Check if the giveaway exists.
-            cursor.execute("SELECT * FROM Ongoing WHERE id = ?", (name,))
-            giveaway_entry = cursor.fetchone()
-            if not giveaway_entry:
+            giveaway_entry = await self.database.fetchone("SELECT * FROM Ongoing WHERE id = ?", (name,))
+            if not giveaway_entry or name in self.ending:
                 await interaction.response.send_message("That giveaway does not exist! Make sure you typed the name exactly as announced.",
                     ephemeral=True)
                 return
@@ -113,54 +466,169 @@ class Gifting(commands.Cog):
                     ephemeral=True)
                 return
             
-            if amount > len(giveaway_entry[2]):
-                participant_count = len(giveaway_entry[2])
+            # Count the entries from the Enter button that are still waiting to be written.
+            await self.flush_entries()
+            participant_count, = await self.database.fetchone("SELECT COUNT(*) FROM Participants WHERE giveaway_id = ?", (name,))
+            if amount > participant_count:
                 await interaction.response.send_message(
                     f"You cannot choose more winners than there are participants (currently {participant_count}).",
                     ephemeral=True
                 )
                 return
-            
-            # Choose winner(s), making sure not to pick the same person twice.
-            winners = random.sample(giveaway_entry[2].split(), amount)
-            # Send a message to the channel congratulating and mentioning the winner(s).
-            winner_ids = [f'<@{winner_id}>' for winner_id in winners]
-            # Create an embed for the giveaway winner(s).
-            embed = discord.Embed(title=f"Winner{'s' if amount > 1 else ''} of the {name} Giveaway",
-                description=f"Congratulations to the winner{'s' if amount > 1 else ''} of the giveaway!", color=0xffff00)
+
+            # Everything past this point can take longer than an interaction allows to respond.
+            # The response is only for whoever ended the giveaway. Answering it right away means the results
+            # are posted as a message of their own, rather than replacing the response.
+            await interaction.response.defer(ephemeral=True, thinking=True)
+            await interaction.edit_original_response(content=f"Ending the **{name}** giveaway...")
             try:
-                host = await self.bot.fetch_user(giveaway_entry[1])
-            except discord.NotFound:
-                host = interaction.user
-
-            embed.set_author(name=host.display_name, icon_url=host.display_avatar)
-            embed.set_thumbnail(url="https://media.tenor.com/3fBEgjA2Y6IAAAAi/giveaway-alert-giveaway.gif")
-            embed.add_field(name=f"Winner{'s' if amount > 1 else ''} ({amount} total)", value="\n".join(winner_ids))
-            embed.set_footer(text="A notification will be sent. Please contact the host to claim your gift.")
-
-            # Attempt to send a message to the chosen winners.
-            for winner in winner_ids:
-                winner = await self.bot.fetch_user(winner[2:-1])
-                if winner:
-                    await winner.send(
-                        f"Congratulations! You have won the **{name}** giveaway on the {interaction.guild.name} server!\n\n"
-                        f"Please contact the host ({host.mention}) or a member of the {interaction.guild.name} staff team "
-                        f"in order to proceed and claim your prize. If the host or a staff member has already reached out to you, "
-                        f"please disregard this message. Thank you so much for your participation!",
-                        embed=embed
-                    )
-                    self.logger.info(f"Sent a message to {winner.name} regarding a giveaway.")
-
-            # Send a message to the channel that the giveaway has ended.
-            await interaction.response.send_message(f"The results are in for the **{name}** giveaway! Congratulations!",
-                embed=embed)
+                summary = await self.end_giveaway(name, giveaway_entry[1], amount, interaction.guild, interaction.followup.send)
+            except Exception as error:
+                # Answer anyway, so the response doesn't stay stuck on ending.
+                self.logger.error(f"An exception has been caught!", exc_info=error)
+                await interaction.edit_original_response(content="Something went wrong while ending the giveaway! "
+                    "Please check the logs.")
+                return
             self.logger.info(f"{interaction.user.name} has decided for the {name} giveaway.")
+            # Let whoever ended the giveaway know who still needs to be contacted.
+            await interaction.edit_original_response(content=summary)
 
-            # Move the giveaway to Archived from Ongoing.
-            cursor.execute("INSERT INTO Archived (id, host, users) VALUES (?, ?, ?)", (name, giveaway_entry[1], giveaway_entry[2]))
-            cursor.execute("DELETE FROM Ongoing WHERE id = ?", (name,))
-            
-        connection.commit()
+
+    # Chooses the winners, archives the giveaway, announces the results with send and messages the winners.
+    # Returns a summary of which winners could be reached.
+    async def end_giveaway(self, name, host_id, amount, guild, send):
+        if name in self.ending:
+            return f"The {name} giveaway is already ending."
+        self.ending.add(name)
+        try:
+            # Include the entries that are still waiting in the buffer.
+            if not await self.flush_entries():
+                raise RuntimeError(f"The buffered entries of the {name} giveaway could not be added.")
+
+            # Choose winner(s), making sure not to pick the same person twice.
+            participants = await self.database.fetchall("SELECT user_id FROM Participants WHERE giveaway_id = ?", (name,))
+            amount = min(amount, len(participants))
+            winners = random.sample([user_id for user_id, in participants], amount)
+
+            # Move the giveaway to Archived from Ongoing, so it can't be ended twice while messages are sent.
+            await self.database.write(
+                ("INSERT INTO Archived (id, host) VALUES (?, ?)", (name, host_id)),
+                ("INSERT INTO ArchivedParticipants SELECT * FROM Participants WHERE giveaway_id = ?", (name,)),
+                ("INSERT INTO ArchivedWinners (giveaway_id, user_id) VALUES (?, ?)", [(name, winner) for winner in winners]),
+                ("DELETE FROM Participants WHERE giveaway_id = ?", (name,)),
+                ("DELETE FROM Ongoing WHERE id = ?", (name,))
+            )
+            self.index.remove(name)
+        finally:
+            self.ending.discard(name)
+
+        # The giveaway is archived by now, so a failed announcement is only logged.
+        async def announce(*args, **kwargs):
+            try:
+                await send(*args, **kwargs)
+                return True
+            except discord.HTTPException as error:
+                self.logger.error(f"The results of the {name} giveaway could not be posted! "
+                    f"Winners: {', '.join(str(winner) for winner in winners) or 'none'}", exc_info=error)
+                return False
+
+        if not winners:
+            await announce(f"The **{name}** giveaway has ended, but nobody entered this time.")
+            return "Nobody entered, so there were no winners to notify."
+
+        # Send a message to the channel congratulating and mentioning the winner(s).
+        winner_ids = [f'<@{winner_id}>' for winner_id in winners]
+        # Create an embed for the giveaway winner(s).
+        embed = discord.Embed(title=f"Winner{'s' if amount > 1 else ''} of the {name} Giveaway",
+            description=f"Congratulations to the winner{'s' if amount > 1 else ''} of the giveaway!", color=0xffff00)
+        host = await self.resolve_user(guild, host_id) or self.bot.user
+
+        embed.set_author(name=host.display_name, icon_url=host.display_avatar)
+        embed.set_thumbnail(url="https://media.tenor.com/3fBEgjA2Y6IAAAAi/giveaway-alert-giveaway.gif")
+        embed.add_field(name=f"Winner{'s' if amount > 1 else ''} ({amount} total)", value="\n".join(winner_ids))
+        embed.set_footer(text="A notification will be sent. Please contact the host to claim your gift.")
+
+        # Send a message to the channel that the giveaway has ended.
+        announced = await announce(f"The results are in for the **{name}** giveaway! Congratulations!", embed=embed)
+
+        # Attempt to send a message to the chosen winners.
+        failed = {}
+        users = await asyncio.gather(*(self.resolve_user(guild, winner, failed) for winner in winners))
+        delivered, undelivered = await self.send_direct_messages([user for user in users if user],
+            f"Congratulations! You have won the **{name}** giveaway on the {guild.name} server!\n\n"
+            f"Please contact the host ({host.mention}) or a member of the {guild.name} staff team "
+            f"in order to proceed and claim your prize. If the host or a staff member has already reached out to you, "
+            f"please disregard this message. Thank you so much for your participation!",
+            embed
+        )
+        failed.update(undelivered)
+
+        summary = f"Notified {len(delivered)} of {amount} winner{'s' if amount > 1 else ''}."
+        if not announced:
+            summary = "The results could not be posted, so please announce them by hand. " + summary
+        if failed:
+            # Keep the list short enough for a single message.
+            lines = [f"<@{user_id}> ({reason})" for user_id, reason in failed.items()]
+            summary += " Could not reach:\n" + "\n".join(lines[:25])
+            summary += f"\n...and {len(lines) - 25} more." if len(lines) > 25 else ""
+        return summary
+
+
+    # Suggests ongoing giveaways as the name is typed.
+    @gift.autocomplete("giveaway")
+    @give.autocomplete("name")
+    async def giveaway_autocomplete(self, interaction: discord.Interaction, current: str):
+        # Discord rejects choices over 100 characters, which giveaways started before the name limit can have.
+        return [app_commands.Choice(name=name, value=name) for name in self.index.search(current) if len(name) <= 100]
+
+
+    # Finds a user in the cache before asking the API. Returns None if they can't be found,
+    # recording the reason in failed if it is given.
+    async def resolve_user(self, guild, user_id, failed=None):
+        user = (guild.get_member(user_id) if guild else None) or self.bot.get_user(user_id)
+        if user:
+            return user
+        try:
+            return await self.bot.fetch_user(user_id)
+        except discord.NotFound:
+            reason = "the account no longer exists"
+        except discord.HTTPException as error:
+            self.logger.error(f"An exception has been caught!", exc_info=error)
+            reason = f"Discord returned an error ({error.status})"
+        if failed is not None:
+            failed[user_id] = reason
+        return None
+
+
+    # Sends a message to each user, a few at a time, trying again when Discord has trouble on its end.
+    # Returns the users that were reached, and the reason for each user that wasn't.
+    async def send_direct_messages(self, users, content, embed):
+        messages = gifting["messages"]
+        limit = asyncio.Semaphore(messages["concurrency"])
+        delivered, failed = [], {}
+
+        async def send(user):
+            async with limit:
+                for attempt in range(messages["attempts"]):
+                    try:
+                        await user.send(content, embed=embed)
+                    except discord.Forbidden:
+                        failed[user.id] = "direct messages are closed"
+                    except discord.HTTPException as error:
+                        if error.status >= 500 and attempt + 1 < messages["attempts"]:
+                            await asyncio.sleep(messages["retry_delay"] * 2 ** attempt)
+                            continue
+                        failed[user.id] = f"Discord returned an error ({error.status})"
+                    except Exception as error:
+                        self.logger.error(f"An exception has been caught!", exc_info=error)
+                        failed[user.id] = "something went wrong"
+                    else:
+                        delivered.append(user)
+                        self.logger.info(f"Sent a message to {user.name} regarding a giveaway.")
+                    return
+
+        await asyncio.gather(*(send(user) for user in users))
+        return delivered, failed
 
 
 async def setup(bot: commands.Bot):
@@ -1,39 +1,106 @@
-import datetime
+import asyncio
+import discord
 
-from discord.ext import commands, tasks
-import pytz
+from discord.ext import commands
+from json import loads
+from pathlib import Path
 
 from logger import create_logger
 
 
-mt = pytz.timezone("US/Mountain")
-time = datetime.time(hour=0, tzinfo=mt)
+kicker = loads(Path("config/kicker.json").read_text())
 
 
 class Kicker(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.logger = create_logger(self.__class__.__name__)
-        self.kicker.start()
+        self.owner_id = None
+        # Only one member can be alone in a channel, so there is at most one timer per channel.
+        # Each one is (member ID, task).
+        self.timers = {}
 
 
-    # This doesn't actually kick anybody, but it keeps me from sitting idle.
-    @tasks.loop(time=time)
-    async def kicker(self):
-        self.logger.info("The sleeping owner check has started.")
+    async def cog_load(self):
+        # If the bot is already running, the ready event has passed, so check right away.
+        if self.bot.is_ready():
+            await self.arm_all()
+
+
+    async def cog_unload(self):
+        for _, task in self.timers.values():
+            task.cancel()
+        self.timers.clear()
+
+
+    # Servers can override any of the default settings.
+    def settings(self, guild):
+        return {**kicker["default"], **kicker["guilds"].get(str(guild.id), {})}
+
+
+    def is_watched(self, member):
+        settings = self.settings(member.guild)
+        return settings["enabled"] and (member.id in settings["members"]
+            or (settings["watch_owner"] and member.id == self.owner_id))
+
+
+    # Arms timers for watched members that are already alone, like after a restart or a reconnect.
+    @commands.Cog.listener()
+    async def on_ready(self):
+        await self.arm_all()
+
+
+    async def arm_all(self):
+        # The owner doesn't change while the bot runs, so look them up once.
+        if self.owner_id is None:
+            self.owner_id = self.bot.owner_id or (await self.bot.application_info()).owner.id
         for guild in self.bot.guilds:
-            for channel in guild.voice_channels:
-                # Store the owner of the voice channel if they are in the channel.
-                owner_id = (await self.bot.application_info()).owner.id
-                owner = next((member for member in channel.members if member.id == \
-                    owner_id), None)
-                if owner and len(channel.members) == 1:
-                    # Bot owner probably fell asleep in voice channel again.
-                    await owner.move_to(None)
-                    self.logger.info(f"{owner.name} has been kicked from {channel.name}.")
-                elif owner:
-                    return # Bot owner is not alone in voice channel. End the task.
-                
+            settings = self.settings(guild)
+            for member_id in settings["members"] + ([self.owner_id] if settings["watch_owner"] else []):
+                # The gateway keeps every member's voice state, so no channel has to be searched.
+                member = guild.get_member(member_id)
+                if member and member.voice and member.voice.channel:
+                    self.update_channel(member.voice.channel)
+
+
+    # Only the channels that were left or joined can have changed who is alone.
+    @commands.Cog.listener()
+    async def on_voice_state_update(self, member: discord.Member, before: discord.VoiceState, after: discord.VoiceState):
+        if before.channel == after.channel:
+            return
+        for channel in [before.channel, after.channel]:
+            if channel:
+                self.update_channel(channel)
+
+
+    # Starts the timer of a watched member that is alone in the channel, and cancels it once they aren't.
+    def update_channel(self, channel):
+        alone = channel.members[0] if len(channel.members) == 1 else None
+        timer = self.timers.get(channel.id)
+        if timer and (not alone or timer[0] != alone.id):
+            timer[1].cancel()
+            del self.timers[channel.id]
+        if alone and channel.id not in self.timers and self.is_watched(alone):
+            task = asyncio.create_task(self.disconnect_later(alone, channel))
+            self.timers[channel.id] = (alone.id, task)
+
+
+    # This doesn't actually kick anybody, but it keeps me from sitting idle.
+    async def disconnect_later(self, member, channel):
+        idle_minutes = self.settings(channel.guild)["idle_minutes"]
+        await asyncio.sleep(idle_minutes * 60)
+        del self.timers[channel.id]
+
+        # Make sure nothing changed without an event, like a missed one during a reconnect.
+        if not member.voice or member.voice.channel != channel or len(channel.members) != 1:
+            return
+        try:
+            # Member probably fell asleep in voice channel again.
+            await member.move_to(None)
+            self.logger.info(f"{member.name} has been kicked from {channel.name} after {idle_minutes} idle minutes.")
+        except discord.HTTPException as error:
+            self.logger.error(f"An exception has been caught!", exc_info=error)
+
 
 async def setup(bot: commands.Bot):
     await bot.add_cog(Kicker(bot))
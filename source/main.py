@@ -1,3 +1,4 @@
+import aiohttp
 import discord
 import os
 
@@ -7,6 +8,7 @@ from pathlib import Path
 
 from logger import create_logger
 
+config = loads(Path("config/config.json").read_text())
 secret = loads(Path("config/secret.json").read_text())
 
 class Manager(commands.Bot):
@@ -21,8 +23,27 @@ class Manager(commands.Bot):
             status=discord.Status.online
         )
         self.logger = create_logger("Main")
+        self.session = None
+        self.session_stats = dict.fromkeys(["requests", "new_connections", "reused_connections",
+            "dns_cache_hits", "dns_cache_misses"], 0)
 
     async def setup_hook(self):
+        # One pooled HTTP client is shared by every module, so connections and DNS lookups are reused.
+        trace_config = aiohttp.TraceConfig()
+        for signal, stat in [(trace_config.on_request_start, "requests"),
+            (trace_config.on_connection_create_end, "new_connections"),
+            (trace_config.on_connection_reuseconn, "reused_connections"),
+            (trace_config.on_dns_cache_hit, "dns_cache_hits"),
+            (trace_config.on_dns_cache_miss, "dns_cache_misses")]:
+            signal.append(self.create_counter(stat))
+        connector = aiohttp.TCPConnector(
+            limit=config["http"]["limit"],
+            limit_per_host=config["http"]["limit_per_host"],
+            ttl_dns_cache=config["http"]["dns_cache_seconds"],
+            keepalive_timeout=config["http"]["keepalive_seconds"]
+        )
+        self.session = aiohttp.ClientSession(connector=connector, trace_configs=[trace_config])
+
         for filename in os.listdir("./source"):
             # Load all of the modules in the modules folder.
             if filename.endswith(".py") and filename not in ["main.py", "logger.py"]:
@@ -31,6 +52,22 @@ class Manager(commands.Bot):
     
         print(f'{bot.user} has connected to Discord!')  # Added message to console
         self.logger.info(f'{bot.user} has connected to Discord!')  # Added message to logger
+
+    def create_counter(self, stat):
+        async def counter(session, context, params):
+            self.session_stats[stat] += 1
+        return counter
+
+    def pool_stats(self):
+        # Combines the traced counters with the current state of the connection pool.
+        connector = self.session.connector
+        return dict(self.session_stats, limit=connector.limit, limit_per_host=connector.limit_per_host,
+            closed=self.session.closed)
+
+    async def close(self):
+        await super().close()
+        if self.session:
+            await self.session.close()
         
 #   @bot.command(name='restart')
 #   @commands.is_owner() # Ensure that only the bot owner can run this command
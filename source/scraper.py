@@ -1,12 +1,21 @@
-import aiohttp
+import asyncio
 import datetime
 import discord
+import functools
+import hashlib
+import os
 import re
+import sqlite3
+import time
 
 from bs4 import BeautifulSoup
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from discord.ext import commands, tasks
-from json import loads
+from html import unescape
+from json import JSONDecoder, dumps, loads
 from pathlib import Path
+from urllib.parse import urlsplit
 
 from logger import create_logger
 
@@ -15,12 +24,285 @@ config = loads(Path("config/config.json").read_text())
 scraper = loads(Path("config/scraper.json").read_text())
 
 
+# Patterns for reading YouTube pages without building a whole soup.
+initial_data_pattern = re.compile(r"ytInitialData\"?\]?\s*=(?!=)\s*")
+meta_pattern = re.compile(r"""<meta\b(?:[^>"']|"[^"]*"|'[^']*')*>""", re.IGNORECASE)
+attribute_pattern = re.compile(r"""([\w:-]+)\s*=\s*(?:"([^"]*)"|'([^']*)')""")
+
+
+# Decodes the ytInitialData object, reading exactly as far as the object goes.
+def extract_initial_data(html):
+    match = initial_data_pattern.search(html)
+    if not match:
+        raise ValueError("The page does not contain any ytInitialData.")
+    data, _ = JSONDecoder().raw_decode(html, match.end())
+    return data
+
+
+# Maps each meta tag's property, itemprop or name to its content. The first tag wins, like soup.find.
+def extract_meta(html):
+    meta = {}
+    for tag in meta_pattern.finditer(html):
+        attributes = {name.lower(): unescape(double or single) for name, double, single
+            in attribute_pattern.findall(tag.group())}
+        if "content" not in attributes:
+            continue
+        for key in ("property", "itemprop", "name"):
+            if key in attributes:
+                meta.setdefault(attributes[key], attributes["content"])
+    return meta
+
+
+# The parsers below run in the worker pool, so they only take and return plain data.
+def parse_soundcloud_listing(html):
+    soup = BeautifulSoup(html, "html.parser")
+    author_name = soup.find("meta", {"property": "og:title"})["content"]
+    author_art = soup.find("meta", {"property": "og:image"})["content"]
+    tracks = soup.find_all("h2", {"itemprop": "name"})
+    track_urls = ["https://soundcloud.com" + track.find("a")["href"] for track in tracks]
+    return author_name, author_art, track_urls
+
+
+def parse_soundcloud_track(html):
+    soup = BeautifulSoup(html, "html.parser")
+    title = soup.find("meta", {"property": "og:title"})["content"]
+    duration = soup.find("meta", {"itemprop": "duration"})["content"]
+    duration = duration[2:].lower().replace("h", ":").replace("m", ":").replace("s", "")
+    published = soup.find("time")
+    published = datetime.datetime.strptime(published.text.strip(), "%Y-%m-%dT%H:%M:%SZ")
+    published = published.strftime("%B %d, %Y")
+    buy_link = soup.find("footer").find("a")["href"] if soup.find("footer").find("a") else None
+    if buy_link and "http" not in buy_link:
+        buy_link = None # No valid link found.
+    upload_art = soup.find("meta", {"property": "og:image"})["content"]
+    return title, upload_art, duration, published, buy_link
+
+
+def parse_youtube_videos(html):
+    data = extract_initial_data(html)
+    meta = extract_meta(html)
+    videos = data['contents']['twoColumnBrowseResultsRenderer']['tabs'][1]['tabRenderer'] \
+        ['content']['richGridRenderer']['contents']
+
+    new_videos = []
+    for video in videos:
+        # Loop through the videos and grab individual data.
+        video = video['richItemRenderer']['content']['videoRenderer']
+        video_title = video['title']['runs'][0]['text']
+        video_art = video['thumbnail']['thumbnails'][0]['url']
+        video_url = "https://www.youtube.com/watch?v=" + video['navigationEndpoint'] \
+            ['watchEndpoint']['videoId']
+        video_duration = video['lengthText']['simpleText']
+        new_videos.append((video_title, video_url, video_art, video_duration))
+    return meta["og:title"], meta["og:image"], new_videos
+
+
+def parse_youtube_releases(html):
+    data = extract_initial_data(html)
+    meta = extract_meta(html)
+    releases = data['contents']['twoColumnBrowseResultsRenderer']['tabs'][3]['tabRenderer'] \
+        ['content']['richGridRenderer']['contents']
+
+    new_releases = []
+    for release in releases:
+        # Loop through the releases and grab individual data.
+        video = release['richItemRenderer']['content']['playlistRenderer']
+        release_title = video['title']['simpleText']
+        release_art = video['thumbnails'][0]['thumbnails'][0]['url']
+        track_count = video['videoCount']
+        release_url = "https://www.youtube.com/watch?v=" + video['navigationEndpoint'] \
+            ['watchEndpoint']['videoId'] + "&list=" + video['navigationEndpoint'] \
+            ['watchEndpoint']['playlistId']
+        new_releases.append((release_title, release_url, release_art, track_count))
+    return meta["og:title"], meta["og:image"], new_releases
+
+
+def parse_youtube_published(html):
+    published = extract_meta(html)["datePublished"]
+    published = datetime.datetime.strptime(published, "%Y-%m-%dT%H:%M:%S%z")
+    return published.strftime("%B %d, %Y")
+
+
+class PageCache:
+    # Remembers the validators of each listing page and a hash of what was parsed from it, so unchanged
+    # listings are skipped.
+    def __init__(self):
+        self.entries, self.pending = {}, {}
+
+
+    # Returns the page, or None if the server says it hasn't changed since it was last committed.
+    async def fetch(self, session, url):
+        etag, last_modified, digest = self.entries.get(url, (None, None, None))
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+        async with session.get(url, headers=headers) as response:
+            if response.status == 304:
+                return None # The server says nothing has changed.
+            html = await response.text()
+            self.pending[url] = (response.headers.get("ETag"), response.headers.get("Last-Modified"), digest)
+        return html
+
+
+    # YouTube sends no validators, and its pages differ on every response because of nonces and tracking
+    # values, so compare what was parsed from the page instead of its bytes.
+    # Returns whether the listing is the same as when it was last committed.
+    def unchanged(self, url, listing):
+        digest = hashlib.sha256(dumps(listing).encode()).hexdigest()
+        if url in self.pending:
+            self.pending[url] = self.pending[url][:2] + (digest,)
+        return digest == self.entries.get(url, (None, None, None))[2]
+
+
+    # Only remember a page once it was fully handled, so a failed check is retried.
+    def commit(self, url):
+        if url in self.pending:
+            self.entries[url] = self.pending.pop(url)
+
+
+    # Forgets a page, so the next check handles it again even if it hasn't changed.
+    def forget(self, url):
+        self.entries.pop(url, None)
+        self.pending.pop(url, None)
+
+
+class SeenStore:
+    # Keeps every scraped URL on disk, so restarts don't need a new baseline.
+    def __init__(self, path):
+        # Check if the database directory exists, if not, create it.
+        if os.path.dirname(path) and not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("""
+        CREATE TABLE IF NOT EXISTS Seen (
+            source TEXT,
+            url TEXT,
+            PRIMARY KEY (source, url)
+        ) WITHOUT ROWID
+        """)
+
+        # Load everything into memory once for quick lookups.
+        self.urls = {}
+        for source, url in self.connection.execute("SELECT source, url FROM Seen"):
+            self.urls.setdefault(source, set()).add(url)
+
+
+    def get(self, source):
+        return self.urls.setdefault(source, set())
+
+
+    def add(self, source, urls):
+        urls = [url for url in urls if url not in self.get(source)]
+        self.connection.executemany("INSERT OR IGNORE INTO Seen (source, url) VALUES (?, ?)",
+            [(source, url) for url in urls])
+        self.connection.commit()
+        self.urls[source].update(urls)
+
+
+class AnnounceQueue:
+    # Groups the announcements of a channel into messages of up to ten embeds, sent after a short delay.
+    def __init__(self, bot, logger):
+        self.bot, self.logger = bot, logger
+        self.pending, self.timers, self.locks, self.sent = {}, {}, {}, {}
+
+
+    # Queues an embed, calling sent once it was actually delivered, or failed if it couldn't be.
+    def add(self, channel_id, embed, sent, failed):
+        self.pending.setdefault(channel_id, []).append((embed, sent, failed))
+        if channel_id not in self.timers:
+            self.timers[channel_id] = asyncio.create_task(self.flush_later(channel_id))
+
+
+    async def flush_later(self, channel_id):
+        await asyncio.sleep(scraper["announcements"]["delay"])
+        self.timers.pop(channel_id, None)
+        await self.flush(channel_id)
+
+
+    # Sends everything that is queued right away, such as when the cog is unloaded.
+    async def flush_all(self):
+        for timer in self.timers.values():
+            timer.cancel()
+        self.timers.clear()
+        for channel_id in list(self.pending):
+            await self.flush(channel_id)
+
+
+    async def flush(self, channel_id):
+        async with self.locks.setdefault(channel_id, asyncio.Lock()):
+            items = self.pending.pop(channel_id, [])
+            channel = self.bot.get_channel(channel_id)
+            if channel is None:
+                self.logger.error(f"The announcement channel {channel_id} could not be found!")
+                for _, _, failed in items:
+                    failed()
+                return
+
+            # Discord allows ten embeds and 6000 characters of embeds per message.
+            batches, size = [], 0
+            for embed, sent, failed in items:
+                if not batches or len(batches[-1]) == 10 or size + len(embed) > 6000:
+                    batches.append([])
+                    size = 0
+                batches[-1].append((embed, sent, failed))
+                size += len(embed)
+
+            for batch in batches:
+                await self.wait_for_rate_limit(channel_id)
+                try:
+                    await channel.send(embeds=[embed for embed, _, _ in batch])
+                except Exception as error:
+                    self.logger.error(f"An announcement with {len(batch)} embeds could not be sent!", exc_info=error)
+                    for _, _, failed in batch:
+                        failed()
+                    continue
+                for _, sent, _ in batch:
+                    sent()
+
+
+    # Keeps to the channel's message rate limit, instead of waiting for Discord to reject a message.
+    async def wait_for_rate_limit(self, channel_id):
+        limit = scraper["announcements"]["rate_limit"]
+        sent = self.sent.setdefault(channel_id, deque(maxlen=limit["messages"]))
+        if len(sent) == sent.maxlen:
+            await asyncio.sleep(max(0, sent[0] + limit["seconds"] - time.monotonic()))
+        sent.append(time.monotonic())
+
+
 class Scraper(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.logger = create_logger(self.__class__.__name__)
-        self.last_tracks, self.last_videos, self.last_releases = [], [], []
-        self.scraper.start()
+        self.seen = SeenStore(scraper["database"])
+        self.host_limits = {}
+        self.cache = PageCache()
+        self.pool = ThreadPoolExecutor(max_workers=scraper["parse_workers"], thread_name_prefix="scraper")
+        self.announcer = AnnounceQueue(bot, self.logger)
+        self.checks = {
+            "soundcloud": self.check_new_soundcloud_tracks,
+            "youtube": self.check_new_youtube_videos,
+            "youtube_music": self.check_new_youtube_music_releases
+        }
+        self.loops = {}
+
+
+    async def cog_load(self):
+        # Each source gets its own loop, so they run on their own schedule.
+        for source in self.checks:
+            loop = tasks.loop(minutes=scraper["sources"][source]["interval"])(self.create_runner(source))
+            loop.before_loop(self.bot.wait_until_ready)
+            loop.start()
+            self.loops[source] = loop
+
+
+    async def cog_unload(self):
+        for loop in self.loops.values():
+            loop.cancel()
+        await self.announcer.flush_all()
+        self.pool.shutdown(wait=False, cancel_futures=True)
 
 
     def create_embed(self, type, title, url, author_name, author_url, author_art,
@@ -49,179 +331,161 @@ class Scraper(commands.Cog):
         return embed
 
 
+    # Fetches the pages in parallel, limited per host, and keeps the given order.
+    async def fetch_pages(self, session, urls):
+        async def fetch_page(url):
+            host = urlsplit(url).netloc
+            if host not in self.host_limits:
+                self.host_limits[host] = asyncio.Semaphore(scraper["concurrency"])
+            async with self.host_limits[host]:
+                async with session.get(url) as response:
+                    return await response.text()
+
+        return await asyncio.gather(*(fetch_page(url) for url in urls))
+
+
+    # Runs a parser in the worker pool, so big pages don't block the event loop.
+    async def parse(self, parser, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.pool, parser, *args)
+
+
     # Separate function for checking new SoundCloud tracks.
-    async def check_new_soundcloud_tracks(self, session, last_tracks):
+    async def check_new_soundcloud_tracks(self, session):
         author_url = scraper["soundcloud_link"]
-        async with session.get(author_url + "/tracks") as response:
-            html = await response.text()
-            soup = BeautifulSoup(html, "html.parser")
-
-            # Scrapes the author's name, art, and track list.
-            author_name = soup.find("meta", {"property": "og:title"})["content"]
-            author_art = soup.find("meta", {"property": "og:image"})["content"]
-            tracks = soup.find_all("h2", {"itemprop": "name"})
-            new_tracks = []
-
-            for track in tracks:
-                # Get the track's information.
-                track_url = "https://soundcloud.com" + track.find("a")["href"]
-                async with session.get(track_url) as response:
-                    html = await response.text()
-                    soup = BeautifulSoup(html, "html.parser")
-                    title = soup.find("meta", {"property": "og:title"})["content"]
-                    duration = soup.find("meta", {"itemprop": "duration"})["content"]
-                    duration = duration[2:].lower().replace("h", ":").replace("m", ":").replace("s", "")
-                    published = soup.find("time")
-                    published = datetime.datetime.strptime(published.text.strip(), "%Y-%m-%dT%H:%M:%SZ")
-                    published = published.strftime("%B %d, %Y")
-                    buy_link = soup.find("footer").find("a")["href"] if soup.find("footer").find("a") else None
-                    if buy_link and "http" not in buy_link:
-                        buy_link = None # No valid link found.
-                    upload_art = soup.find("meta", {"property": "og:image"})["content"]
-                track_info = (title, track_url, author_name, author_url, author_art, upload_art,
-                    duration, published, buy_link)
-                new_tracks.append(track_info)
-
-            # Check if the held data is empty.
-            if not last_tracks:
-                last_tracks = [track_info[1] for track_info in new_tracks]
-                return last_tracks
-            
-            for track_info in new_tracks:
-                # Compare to see if the exact data is already posted.
-                if track_info[1] not in last_tracks:
-                    self.logger.info(f"A new SoundCloud track was scraped called {track_info[0]}.")
-                    last_tracks.append(track_info[1])
-                    embed = self.create_embed("track", *track_info)
-                    channel = self.bot.get_channel(config["channels"]["#content-updates"])
-                    await channel.send(embed=embed)
-
-        return last_tracks
+        listing_url = author_url + "/tracks"
+        html = await self.cache.fetch(session, listing_url)
+        if html is None:
+            return # The listing hasn't changed since the last check.
+
+        # Scrapes the author's name, art, and track list.
+        author_name, author_art, track_urls = await self.parse(parse_soundcloud_listing, html)
+        if self.cache.unchanged(listing_url, [author_name, author_art, track_urls]):
+            self.cache.commit(listing_url)
+            return # The listing hasn't changed since the last check.
+
+        # Check if the held data is empty.
+        last_tracks = self.seen.get("soundcloud")
+        if not last_tracks:
+            self.seen.add("soundcloud", track_urls)
+            self.cache.commit(listing_url)
+            return
+
+        # Only fetch the pages of tracks that were not posted yet.
+        track_urls = [track_url for track_url in track_urls if track_url not in last_tracks]
+        track_pages = await self.fetch_pages(session, track_urls)
+
+        for track_url, html in zip(track_urls, track_pages):
+            # Get the track's information.
+            title, upload_art, duration, published, buy_link = await self.parse(parse_soundcloud_track, html)
+            track_info = (title, track_url, author_name, author_url, author_art, upload_art,
+                duration, published, buy_link)
+
+            self.logger.info(f"A new SoundCloud track was scraped called {track_info[0]}.")
+            embed = self.create_embed("track", *track_info)
+            self.announcer.add(config["channels"]["#content-updates"], embed,
+                functools.partial(self.seen.add, "soundcloud", [track_info[1]]),
+                # The item wasn't marked as seen, so check the listing again even if it hasn't changed.
+                functools.partial(self.cache.forget, listing_url))
+
+        self.cache.commit(listing_url)
 
 
     # Separate function for checking new YouTube videos.
-    async def check_new_youtube_videos(self, session, last_videos):
+    async def check_new_youtube_videos(self, session):
         author_url = scraper["youtube_link"]
-        async with session.get(author_url + "/videos") as response:
-            html = await response.text()
-            soup = BeautifulSoup(html, "html.parser")
-
-            # Grab the JSON data from the page.
-            script = soup.find("script", text=re.compile("ytInitialData"))
-            json_text = re.search(r"ytInitialData\s*=\s*({.*?});", script.string).group(1)
-            data = loads(json_text)
-
-            # Grab the list of videos from the scraped JSON data.
-            videos = data['contents']['twoColumnBrowseResultsRenderer']['tabs'][1]['tabRenderer'] \
-                ['content']['richGridRenderer']['contents']
-            
-            # Scrape the author name and art from the page.
-            author_name = soup.find("meta", {"property": "og:title"})["content"]
-            author_art = soup.find("meta", {"property": "og:image"})["content"]
-            new_videos = []
-
-            for video in videos:
-                # Loop through the videos and grab individual data.
-                video = video['richItemRenderer']['content']['videoRenderer']
-                video_title = video['title']['runs'][0]['text']
-                video_art = video['thumbnail']['thumbnails'][0]['url']
-                video_url = "https://www.youtube.com/watch?v=" + video['navigationEndpoint'] \
-                    ['watchEndpoint']['videoId']
-                video_duration = video['lengthText']['simpleText']
-                async with session.get(video_url) as response:
-                    html = await response.text()
-                    soup = BeautifulSoup(html, "html.parser")
-                    video_published = soup.find("meta", {"itemprop": "datePublished"})
-                    video_published = datetime.datetime.strptime(video_published["content"], "%Y-%m-%dT%H:%M:%S%z")
-                    video_published = video_published.strftime("%B %d, %Y")
-                video_info = (video_title, video_url, author_name, author_url, author_art, video_art,
-                    video_duration, video_published)
-                new_videos.append(video_info)
-
-            # Check if the held data is empty.
-            if not last_videos:
-                last_videos = [video_info[1] for video_info in new_videos]
-                return last_videos
-            
-            for video_info in new_videos:
-                if video_info[1] not in last_videos:
-                    self.logger.info(f"A new YouTube video was scraped called {video_info[0]}.")
-                    last_videos.append(video_info[1])
-                    embed = self.create_embed("video", *video_info)
-                    channel = self.bot.get_channel(config["channels"]["#content-updates"])
-                    await channel.send(embed=embed)
-
-        return last_videos
+        listing_url = author_url + "/videos"
+        html = await self.cache.fetch(session, listing_url)
+        if html is None:
+            return # The listing hasn't changed since the last check.
+
+        # Grab the author's details and the list of videos from the page.
+        author_name, author_art, new_videos = await self.parse(parse_youtube_videos, html)
+        if self.cache.unchanged(listing_url, [author_name, author_art, [video[1] for video in new_videos]]):
+            self.cache.commit(listing_url)
+            return # The listing hasn't changed since the last check.
+
+        # Check if the held data is empty.
+        last_videos = self.seen.get("youtube")
+        if not last_videos:
+            self.seen.add("youtube", [video[1] for video in new_videos])
+            self.cache.commit(listing_url)
+            return
+
+        # Only fetch the pages of videos that were not posted yet.
+        new_videos = [video for video in new_videos if video[1] not in last_videos]
+        video_pages = await self.fetch_pages(session, [video[1] for video in new_videos])
+
+        for (video_title, video_url, video_art, video_duration), html in zip(new_videos, video_pages):
+            video_published = await self.parse(parse_youtube_published, html)
+            video_info = (video_title, video_url, author_name, author_url, author_art, video_art,
+                video_duration, video_published)
+
+            self.logger.info(f"A new YouTube video was scraped called {video_info[0]}.")
+            embed = self.create_embed("video", *video_info)
+            self.announcer.add(config["channels"]["#content-updates"], embed,
+                functools.partial(self.seen.add, "youtube", [video_info[1]]),
+                # The item wasn't marked as seen, so check the listing again even if it hasn't changed.
+                functools.partial(self.cache.forget, listing_url))
+
+        self.cache.commit(listing_url)
 
 
     # Separate function for checking new YouTube Music releases.
-    async def check_new_youtube_music_releases(self, session, last_releases):
+    async def check_new_youtube_music_releases(self, session):
         author_url = scraper["youtube_link"]
-        async with session.get(author_url + "/releases") as response:
-            html = await response.text()
-            soup = BeautifulSoup(html, "html.parser")
-            
-            # Grab the JSON data from the page.
-            script = soup.find("script", text=re.compile("ytInitialData"))
-            json_text = re.search(r"ytInitialData\s*=\s*({.*?});", script.string).group(1)
-            data = loads(json_text)
-
-            # Grab the list of releases from scraped JSON data.
-            releases = data['contents']['twoColumnBrowseResultsRenderer']['tabs'][3]['tabRenderer'] \
-                ['content']['richGridRenderer']['contents']
-            
-            # Scrape the author name and art from the page.
-            author_name = soup.find("meta", {"property": "og:title"})["content"]
-            author_art = soup.find("meta", {"property": "og:image"})["content"]
-            new_releases = []
-
-            for release in releases:
-                # Loop through the releases and grab individual data.
-                video = release['richItemRenderer']['content']['playlistRenderer']
-                release_title = video['title']['simpleText']
-                release_art = video['thumbnails'][0]['thumbnails'][0]['url']
-                track_count = video['videoCount']
-                release_url = "https://www.youtube.com/watch?v=" + video['navigationEndpoint'] \
-                    ['watchEndpoint']['videoId'] + "&list=" + video['navigationEndpoint'] \
-                    ['watchEndpoint']['playlistId']
-                async with session.get(release_url) as response:
-                    html = await response.text()
-                    soup = BeautifulSoup(html, "html.parser")
-                    release_published = soup.find("meta", {"itemprop": "datePublished"})
-                    release_published = datetime.datetime.strptime(release_published["content"], "%Y-%m-%dT%H:%M:%S%z")
-                    release_published = release_published.strftime("%B %d, %Y")
-                release_info = (release_title, release_url, author_name, author_url, author_art,
-                    release_art, track_count, release_published)
-                new_releases.append(release_info)
-
-            # Check if the held data is empty.
-            if not last_releases:
-                last_releases = [release_info[1] for release_info in new_releases]
-                return last_releases
-            
-            for release_info in new_releases:
-                # Compare to see if the exact data already was posted.
-                if release_info[1] not in last_releases:
-                    self.logger.info(f"A new YouTube Music release was scraped called {release_info[0]}")
-                    last_releases.append(release_info[1])
-                    embed = self.create_embed("release", *release_info)
-                    channel = self.bot.get_channel(config["channels"]["#content-updates"])
-                    await channel.send(embed=embed)
-
-            return last_releases
-
-
-    # Main function for the on_ready event
-    @tasks.loop(minutes=5)
-    async def scraper(self):
-        async with aiohttp.ClientSession() as session:
-            try:
-                self.logger.info("A web scraping session has started.")
-                self.last_tracks = await self.check_new_soundcloud_tracks(session, self.last_tracks)
-                self.last_videos = await self.check_new_youtube_videos(session, self.last_videos)
-                self.last_releases = await self.check_new_youtube_music_releases(session, self.last_releases)
-            except Exception as error:
-                self.logger.error(f"An exception has been caught!", exc_info=error)
+        listing_url = author_url + "/releases"
+        html = await self.cache.fetch(session, listing_url)
+        if html is None:
+            return # The listing hasn't changed since the last check.
+
+        # Grab the author's details and the list of releases from the page.
+        author_name, author_art, new_releases = await self.parse(parse_youtube_releases, html)
+        if self.cache.unchanged(listing_url, [author_name, author_art, [release[1] for release in new_releases]]):
+            self.cache.commit(listing_url)
+            return # The listing hasn't changed since the last check.
+
+        # Check if the held data is empty.
+        last_releases = self.seen.get("youtube_music")
+        if not last_releases:
+            self.seen.add("youtube_music", [release[1] for release in new_releases])
+            self.cache.commit(listing_url)
+            return
+
+        # Only fetch the pages of releases that were not posted yet.
+        new_releases = [release for release in new_releases if release[1] not in last_releases]
+        release_pages = await self.fetch_pages(session, [release[1] for release in new_releases])
+
+        for (release_title, release_url, release_art, track_count), html in zip(new_releases, release_pages):
+            release_published = await self.parse(parse_youtube_published, html)
+            release_info = (release_title, release_url, author_name, author_url, author_art,
+                release_art, track_count, release_published)
+
+            self.logger.info(f"A new YouTube Music release was scraped called {release_info[0]}")
+            embed = self.create_embed("release", *release_info)
+            self.announcer.add(config["channels"]["#content-updates"], embed,
+                functools.partial(self.seen.add, "youtube_music", [release_info[1]]),
+                # The item wasn't marked as seen, so check the listing again even if it hasn't changed.
+                functools.partial(self.cache.forget, listing_url))
+
+        self.cache.commit(listing_url)
+
+
+    # Creates the loop function for a source, since every source is scheduled separately.
+    def create_runner(self, source):
+        async def runner():
+            await self.scrape(source)
+        return runner
+
+
+    # Runs a single source, so a failure or slow site doesn't hold back the others.
+    async def scrape(self, source):
+        try:
+            self.logger.info(f"A web scraping session has started for {source}.")
+            await asyncio.wait_for(self.checks[source](self.bot.session), scraper["sources"][source]["timeout"])
+        except asyncio.TimeoutError:
+            self.logger.warning(f"The web scraping session for {source} has timed out.")
+        except Exception as error:
+            self.logger.error(f"An exception has been caught!", exc_info=error)
 
 
 async def setup(bot: commands.Bot):